@@ -0,0 +1,173 @@
+"""
+    Registry of the contract ABIs shipped with this repo
+
+    contract_info.json, NFT.abi and ape_abi.json are parsed once per process,
+    function selectors and event topics are computed once per file version
+    (the processed form is cached on disk under .abi_cache/, keyed by the
+    sha256 of the file), and web3 contract factories are built once per Web3
+    instance.
+
+        src = abi_registry.get("source")                 # ContractSpec
+        src.topics["Deposit"], src.selectors["withdraw"]
+        C = abi_registry.contract(w3, "source")          # ready contract object
+"""
+import hashlib
+import json
+import os
+import pickle
+import threading
+import weakref
+from pathlib import Path
+
+CACHE_VERSION = 1
+CACHE_DIR = ".abi_cache"
+
+# default files and the registry name of single-ABI files (contract_info.json holds one ABI per section)
+DEFAULT_FILES = {
+    "contract_info.json": None,
+    "NFT.abi": "nft",
+    "ape_abi.json": "ape",
+}
+
+
+class ContractSpec:
+    """
+        One processed ABI, with selectors (4-byte hex) and topics (32-byte hex) by name
+    """
+    __slots__ = ("name", "address", "abi", "selectors", "topics", "events")
+
+    def __init__(self, name, address, abi, selectors, topics, events):
+        self.name = name
+        self.address = address
+        self.abi = abi
+        self.selectors = selectors
+        self.topics = topics
+        self.events = events
+
+    def event_abi(self, event_name):
+        return self.events[event_name]
+
+    def __repr__(self):
+        return f"ContractSpec({self.name!r}, address={self.address!r})"
+
+
+def canonical_type(arg):
+    """
+        Canonical ABI type of an input, expanding tuples into their components
+    """
+    typ = arg["type"]
+    if typ.startswith("tuple"):
+        return "(" + ",".join(canonical_type(c) for c in arg["components"]) + ")" + typ[5:]
+    return typ
+
+
+def signature(item):
+    return f"{item['name']}({','.join(canonical_type(i) for i in item.get('inputs', []))})"
+
+
+def _process(name, abi, address=None):
+    from eth_utils import keccak
+
+    selectors, topics, events = {}, {}, {}
+    for item in abi:
+        if item.get("type") == "function":
+            sel = "0x" + keccak(text=signature(item))[:4].hex()
+            # overloaded functions keep every selector under name(types)
+            selectors.setdefault(item["name"], sel)
+            selectors[signature(item)] = sel
+        elif item.get("type") == "event":
+            topic = "0x" + keccak(text=signature(item)).hex()
+            topics.setdefault(item["name"], topic)
+            topics[signature(item)] = topic
+            events.setdefault(item["name"], item)
+    return ContractSpec(name, address, abi, selectors, topics, events)
+
+
+def _process_file(raw, path, name):
+    data = json.loads(raw)
+    if isinstance(data, list):
+        spec = _process(name or Path(path).stem, data)
+        return {spec.name: spec}
+    return {section: _process(section, cfg["abi"], cfg.get("address")) for section, cfg in data.items()}
+
+
+def _from_disk_cache(raw, path, name):
+    """
+        Returns the processed specs of a file, reusing the pickled form if the file is unchanged
+    """
+    digest = hashlib.sha256(raw).hexdigest()
+    cache_file = Path(path).parent / CACHE_DIR / f"{Path(path).name}.{digest[:16]}.v{CACHE_VERSION}.pickle"
+    try:
+        with open(cache_file, "rb") as f:
+            return pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError):
+        pass
+
+    specs = _process_file(raw, path, name)
+    try:
+        os.makedirs(cache_file.parent, exist_ok=True)
+        tmp = cache_file.with_suffix(".tmp")
+        with open(tmp, "wb") as f:
+            pickle.dump(specs, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, cache_file)
+    except OSError as e:
+        print( f"Could not write ABI cache {cache_file}: {e}" )
+    return specs
+
+
+_lock = threading.Lock()
+_loaded = {}     # resolved path -> (mtime_ns, {name: ContractSpec})
+_registry = {}   # name -> ContractSpec, from every file loaded so far
+_factories = weakref.WeakKeyDictionary()  # Web3 -> {name: contract factory}
+
+
+def load(path="contract_info.json", name=None):
+    """
+        Loads an ABI file (once per process while the file is unchanged) and
+        returns {name: ContractSpec} for the contracts it describes
+    """
+    resolved = str(Path(path).resolve())
+    mtime = os.stat(resolved).st_mtime_ns
+    with _lock:
+        hit = _loaded.get(resolved)
+        if hit is not None and hit[0] == mtime:
+            return hit[1]
+        with open(resolved, "rb") as f:
+            raw = f.read()
+        specs = _from_disk_cache(raw, resolved, name if name is not None else DEFAULT_FILES.get(Path(path).name))
+        _loaded[resolved] = (mtime, specs)
+        _registry.update(specs)
+        return specs
+
+
+def get(name, directory=None):
+    """
+        Returns the ContractSpec called 'name', loading the default files on first use
+    """
+    if name not in _registry:
+        base = Path(directory) if directory else Path(".")
+        for file in DEFAULT_FILES:
+            if (base / file).is_file():
+                load(base / file)
+    return _registry[name]
+
+
+def contract(w3, name, address=None, path=None):
+    """
+        Returns a contract object for 'name' bound to w3 (at 'address' or the address in the ABI file)
+
+        The web3 contract factory is bound to w3, so it is built once per Web3
+        instance and reused only by callers that keep their Web3 (bridge.connect_to
+        returns the same one per chain); a fresh Web3 builds a fresh factory.
+    """
+    spec = load(path)[name] if path else get(name)
+    factories = _factories.setdefault(w3, {})
+    key = (name, id(spec))
+    factory = factories.get(key)
+    if factory is None:
+        factory = factories[key] = w3.eth.contract(abi=spec.abi)
+    address = address or spec.address
+    if address is None:
+        return factory
+    from web3 import Web3
+    return factory(address=Web3.to_checksum_address(address))
@@ -0,0 +1,173 @@
+"""
+    Offline model of AMM.sol, the two-token constant-product pool
+
+    Pool state (balances of tokenA and tokenB, and the stored invariant) is
+    rebuilt by replaying the pool's Swap, LiquidityProvision and Withdrawal
+    events, fetched with one eth_getLogs per logdecoder.MAX_RANGE block window.
+    Trades are then priced locally with the contract's own integer arithmetic:
+
+        amountInWithFee = sellAmount * (10000 - feebps) // 10000
+        out             = reserveOut - invariant // (reserveIn + amountInWithFee)
+
+    quote() takes a whole array of sell amounts and evaluates them at once with
+    NumPy.  When every intermediate product fits in int64 the int64 kernels are
+    used, otherwise the arrays hold Python ints (dtype=object) so uint256
+    amounts round exactly like the EVM does.
+
+        pool = amm_sim.replay(w3, amm_address, from_block, to_block)
+        out = pool.quote(pool.token_a, [10**18, 5 * 10**18, 10**19])
+
+    Tokens sent to the pool without an event are not seen by the replay; load
+    the state at a recent block with Pool.at_block to pick those up.
+"""
+import logdecoder
+
+FEE_BPS = 3
+BPS = 10_000
+INT64_MAX = 2 ** 63 - 1
+
+SWAP_TOPIC = logdecoder.KNOWN_TOPICS["Swap(address,address,uint256,uint256)"]
+PROVISION_TOPIC = logdecoder.KNOWN_TOPICS["LiquidityProvision(address,uint256,uint256)"]
+WITHDRAWAL_TOPIC = logdecoder.KNOWN_TOPICS["Withdrawal(address,address,uint256,uint256)"]
+
+# selectors of the AMM's and ERC20's view functions
+TOKEN_A = "0x0fc63d10"      # tokenA()
+TOKEN_B = "0x5f64b55b"      # tokenB()
+INVARIANT = "0xb03a9a05"    # invariant()
+BALANCE_OF = "0x70a08231"   # balanceOf(address)
+
+
+def amounts_out(sell_amounts, reserve_in, reserve_out, invariant, fee_bps=FEE_BPS):
+    """
+        Vectorized tradeTokens: returns the buy amount for each sell amount,
+        0 where the contract would revert (no liquidity, nothing out, underflow or a trade
+        that lowers the invariant)
+    """
+    import numpy as np
+
+    amounts = np.asarray(sell_amounts, dtype=object)
+    largest = max((int(a) for a in amounts.flat), default=0)
+    bound = max((reserve_in + largest) * max(reserve_out, 1), largest * BPS, invariant)
+    if bound <= INT64_MAX:
+        amounts = amounts.astype(np.int64)
+
+    with_fee = amounts * (BPS - fee_bps) // BPS
+    denom = reserve_in + with_fee
+    new_out = invariant // np.where(denom > 0, denom, 1)
+    out = reserve_out - new_out
+    ok = (invariant > 0) & (amounts > 0) & (denom > 0) & (new_out <= reserve_out) & (out > 0)
+    # require( new_invariant >= invariant ) on the balances after the transfers
+    ok &= (reserve_in + amounts) * (reserve_out - np.where(ok, out, 0)) >= invariant
+    return np.where(ok, out, 0)
+
+
+class Pool:
+    """
+        Balances and invariant of one AMM.sol pool
+    """
+
+    def __init__(self, token_a, token_b, balance_a=0, balance_b=0, invariant=0, fee_bps=FEE_BPS):
+        self.token_a = token_a.lower()
+        self.token_b = token_b.lower()
+        self.balance_a = balance_a
+        self.balance_b = balance_b
+        self.invariant = invariant
+        self.fee_bps = fee_bps
+        self.block = None
+
+    @classmethod
+    def at_block(cls, w3, address, block="latest"):
+        """
+            Reads tokenA, tokenB and the invariant, then both balances, at 'block' (two JSON-RPC batches)
+        """
+        with w3.batch_requests() as batch:
+            for data in (TOKEN_A, TOKEN_B, INVARIANT):
+                batch.add(w3.eth.call({"to": address, "data": data}, block))
+            token_a, token_b, invariant = batch.execute()
+        token_a = "0x" + bytes(token_a)[-20:].hex()
+        token_b = "0x" + bytes(token_b)[-20:].hex()
+
+        from web3 import Web3
+        holder = BALANCE_OF + logdecoder.address_word(address)
+        with w3.batch_requests() as batch:
+            for token in (token_a, token_b):
+                batch.add(w3.eth.call({"to": Web3.to_checksum_address(token), "data": holder}, block))
+            balance_a, balance_b = batch.execute()
+
+        pool = cls(token_a, token_b, int.from_bytes(balance_a, "big"), int.from_bytes(balance_b, "big"),
+                   int.from_bytes(invariant, "big"))
+        pool.block = block if isinstance(block, int) else None
+        return pool
+
+    def _reset_invariant(self):
+        self.invariant = self.balance_a * self.balance_b
+
+    def apply(self, evt):
+        """
+            Updates the pool from one decoded AMM event (see logdecoder.AMM_DECODERS)
+        """
+        if evt.event == "Swap":
+            if evt._inToken == self.token_a:
+                self.balance_a += evt.inAmt
+                self.balance_b -= evt.outAmt
+            else:
+                self.balance_b += evt.inAmt
+                self.balance_a -= evt.outAmt
+        elif evt.event == "LiquidityProvision":
+            self.balance_a += evt.AQty
+            self.balance_b += evt.BQty
+        elif evt.event == "Withdrawal":
+            self.balance_a -= evt.AQty
+            self.balance_b -= evt.BQty
+        else:
+            return
+        self._reset_invariant()
+        self.block = evt.blockNumber
+
+    def reserves(self, sell_token):
+        """
+            (reserve_in, reserve_out) for a trade selling 'sell_token'
+        """
+        if sell_token.lower() == self.token_a:
+            return self.balance_a, self.balance_b
+        if sell_token.lower() == self.token_b:
+            return self.balance_b, self.balance_a
+        raise ValueError(f"{sell_token} is not one of the pool's tokens")
+
+    def quote(self, sell_token, sell_amounts):
+        """
+            Buy amounts for an array of sell amounts of 'sell_token', as tradeTokens would pay them now
+        """
+        reserve_in, reserve_out = self.reserves(sell_token)
+        return amounts_out(sell_amounts, reserve_in, reserve_out, self.invariant, self.fee_bps)
+
+    def slippage(self, sell_token, sell_amounts):
+        """
+            Fraction of the spot price lost by each trade (fee included), as floats
+        """
+        import numpy as np
+
+        reserve_in, reserve_out = self.reserves(sell_token)
+        amounts = np.asarray(sell_amounts, dtype=object)
+        out = self.quote(sell_token, amounts)
+        spot = reserve_out / reserve_in if reserve_in else 0.0
+        with np.errstate(divide="ignore", invalid="ignore"):
+            price = out.astype(float) / amounts.astype(float)
+            return 1.0 - price / spot if spot else np.full(price.shape, np.nan)
+
+
+def replay(w3, address, from_block, to_block, pool=None):
+    """
+        Replays the pool's events in [from_block, to_block] onto 'pool' and returns it.
+        Without a pool the state is read at from_block - 1 first.
+    """
+    if pool is None:
+        pool = Pool.at_block(w3, address, max(0, from_block - 1))
+    topics = [[SWAP_TOPIC, PROVISION_TOPIC, WITHDRAWAL_TOPIC]]
+    for frm in range(from_block, to_block + 1, logdecoder.MAX_RANGE):
+        logs = logdecoder.get_raw_logs(w3, frm, min(frm + logdecoder.MAX_RANGE - 1, to_block), address, topics)
+        for evt in logdecoder.decode_logs(logs, logdecoder.AMM_DECODERS):
+            if not evt.removed:
+                pool.apply(evt)
+    pool.block = to_block
+    return pool
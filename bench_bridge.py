@@ -0,0 +1,276 @@
+"""
+    Local two-chain load test for bridge.scan_blocks
+
+    Spins up two in-process eth-tester (py-evm) chains standing in for Fuji and
+    BSC, deploys Source.sol and src/Destination.sol on them, registers a token,
+    then alternates between generating deposit / unwrap load and running the
+    bridge until every event has been relayed.  Reports relay throughput,
+    end-to-end latency percentiles, RPC calls per event and gas per relay.
+
+    The bridge talks to the chains through its own Web3s carrying the production
+    middleware (rpc_stack.install: POA, rpc_metrics, rpc_scheduler, rpc_cache),
+    so cache hits and rate limiting show in the figures; the load generator
+    uses bare Web3s on the same chains.  --rpc-rate sets the
+    scheduler's requests per second; left out it is rpc_scheduler.DEFAULT_RATE
+    (20/s per chain), which caps the bridge's throughput, so compare runs made
+    with the same rate (the report includes it).
+
+    python bench_bridge.py --deposits 200 --unwraps 100 --batch 10
+
+    Needs the packages in requirements-bench.txt and OpenZeppelin Contracts 4.x
+    (the sources pin solidity ^0.8.17, 5.x needs 0.8.20) checked out in
+    lib/openzeppelin-contracts; py-solc-x downloads solc 0.8.17 on first use.
+    Pass --max-p99 / --min-eps to fail (exit 1) when a run regresses past those
+    limits.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from collections import Counter
+
+import bridge
+import logdecoder
+import rpc_metrics
+import rpc_scheduler
+import rpc_stack
+import token_registry
+
+SOLC_VERSION = "0.8.17"
+OZ_REMAP = {"@openzeppelin/contracts": "lib/openzeppelin-contracts/contracts"}
+WARDEN_ROLE_NAME = "BRIDGE_WARDEN_ROLE"  # keccak preimage of WARDEN_ROLE in both contracts
+
+
+def compile_contracts():
+    """
+        Compiles Source, Destination and BridgeToken, returns {name: (abi, bytecode)}
+    """
+    import solcx
+
+    if SOLC_VERSION not in [str(v) for v in solcx.get_installed_solc_versions()]:
+        solcx.install_solc(SOLC_VERSION)
+    out = solcx.compile_files(
+        ["Source.sol", "src/Destination.sol"],
+        output_values=["abi", "bin"],
+        import_remappings=OZ_REMAP,
+        solc_version=SOLC_VERSION,
+        allow_paths=[os.getcwd()],
+    )
+    contracts = {}
+    for key, value in out.items():
+        name = key.split(":")[-1]
+        if name in ("Source", "Destination", "BridgeToken"):
+            contracts[name] = (value["abi"], value["bin"])
+    return contracts
+
+
+def make_chain():
+    from web3 import Web3, EthereumTesterProvider
+
+    w3 = Web3(EthereumTesterProvider())
+    return w3
+
+
+def deploy(w3, abi, bytecode, *args, sender):
+    contract = w3.eth.contract(abi=abi, bytecode=bytecode)
+    tx_hash = contract.constructor(*args).transact({"from": sender})
+    receipt = w3.eth.wait_for_transaction_receipt(tx_hash)
+    return w3.eth.contract(address=receipt.contractAddress, abi=abi)
+
+
+def setup(workdir, rpc_rate=None):
+    """
+        Deploys the bridge on two fresh chains and points bridge.py at them
+
+        Returns a dict with the chains, contracts and accounts used by the load generator
+    """
+    from eth_account import Account
+    from web3 import Web3
+
+    compiled = compile_contracts()
+    src_w3, dst_w3 = make_chain(), make_chain()
+
+    warden = Account.create()
+    env = {"src_w3": src_w3, "dst_w3": dst_w3, "warden": warden}
+    for side, w3 in (("src", src_w3), ("dst", dst_w3)):
+        admin, user = w3.eth.accounts[0], w3.eth.accounts[1]
+        w3.eth.send_transaction({"from": admin, "to": warden.address, "value": 10 ** 21})
+        env[f"{side}_admin"], env[f"{side}_user"] = admin, user
+
+    role = Web3.keccak(text=WARDEN_ROLE_NAME)
+
+    # Source chain: the bridge, and a BridgeToken standing in for the underlying ERC20
+    admin = env["src_admin"]
+    source = deploy(src_w3, *compiled["Source"], admin, sender=admin)
+    token = deploy(src_w3, *compiled["BridgeToken"], admin, "Test", "TST", admin, sender=admin)
+    source.functions.grantRole(role, warden.address).transact({"from": admin})
+    source.functions.registerToken(token.address).transact({"from": admin})
+    token.functions.mint(env["src_user"], 10 ** 30).transact({"from": admin})
+    token.functions.approve(source.address, 2 ** 256 - 1).transact({"from": env["src_user"]})
+
+    # Destination chain: the bridge and the wrapped token it creates
+    admin = env["dst_admin"]
+    destination = deploy(dst_w3, *compiled["Destination"], admin, sender=admin)
+    destination.functions.grantRole(role, warden.address).transact({"from": admin})
+    destination.functions.createToken(token.address, "Wrapped", "wTST").transact({"from": admin})
+    wrapped = destination.functions.wrapped_tokens(token.address).call()
+
+    env.update(source=source, destination=destination, token=token, wrapped=wrapped)
+
+    info = {
+        "source": {"address": source.address, "abi": compiled["Source"][0]},
+        "destination": {"address": destination.address, "abi": compiled["Destination"][0]},
+    }
+    env["contract_info"] = os.path.join(workdir, "contract_info.json")
+    with open(env["contract_info"], "w") as f:
+        json.dump(info, f)
+
+    key_file = os.path.join(workdir, "secret_key.txt")
+    with open(key_file, "w") as f:
+        f.write(warden.key.hex())
+    bridge.KEY_FILE = key_file
+    bridge.STATEFILE = os.path.join(workdir, ".bridge.last")
+    bridge.save_state({"fuji": src_w3.eth.block_number, "bsc": dst_w3.eth.block_number})
+    # the bridge's own connections, with the middleware stack connect_to installs
+    os.environ.pop("RPC_CACHE_DIR", None)  # never mix cached testnet answers into the local chains
+    env["src_metrics"], env["dst_metrics"] = rpc_metrics.RpcMetrics(), rpc_metrics.RpcMetrics()
+    env["rpc_rate"] = rpc_rate or rpc_scheduler.DEFAULT_RATE
+    bridge_src = rpc_stack.install(Web3(src_w3.provider), "avax", env["src_metrics"], rpc_rate)
+    bridge_dst = rpc_stack.install(Web3(dst_w3.provider), "bsc", env["dst_metrics"], rpc_rate)
+    bridge.connect_to = lambda chain: bridge_src if chain == "source" else bridge_dst
+    token_registry._registry = token_registry.TokenRegistry(os.path.join(workdir, "tokens.json"))
+    return env
+
+
+def relayed_events(w3, address, topic, from_block):
+    logs = logdecoder.get_raw_logs(w3, from_block, "latest", address, [topic])
+    return logdecoder.decode_logs(logs)
+
+
+def method_calls(metrics):
+    calls = Counter()
+    for methods in metrics.snapshot().values():
+        for method, stats in methods.items():
+            calls[method] += stats["calls"]
+    return calls
+
+
+def percentile(values, p):
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    k = min(len(values) - 1, max(0, int(round(p / 100 * (len(values) - 1)))))
+    return values[k]
+
+
+def run(env, deposits, unwraps, batch, max_rounds=1000):
+    """
+        Generates 'deposits' Deposit and 'unwraps' Unwrap events in batches of 'batch',
+        relaying after every batch, and returns the measurements
+    """
+    src_w3, dst_w3 = env["src_w3"], env["dst_w3"]
+    source, destination, token = env["source"], env["destination"], env["token"]
+    user_src, user_dst = env["src_user"], env["dst_user"]
+
+    src_metrics, dst_metrics = env["src_metrics"], env["dst_metrics"]
+    src_start, dst_start = src_w3.eth.block_number + 1, dst_w3.eth.block_number + 1
+    wrap_topic = logdecoder.KNOWN_TOPICS["Wrap(address,address,address,uint256)"]
+    withdraw_topic = logdecoder.KNOWN_TOPICS["Withdrawal(address,address,uint256)"]
+
+    # amounts are unique so that each relay can be matched to the event that caused it
+    submitted = {}
+    relayed = {}
+    done_deposits = done_unwraps = 0
+    bridge_time = 0.0
+    seen_wraps = seen_withdrawals = 0
+
+    started = time.perf_counter()
+    for _ in range(max_rounds):
+        for _ in range(min(batch, deposits - done_deposits)):
+            amount = 10 ** 18 + done_deposits
+            source.functions.deposit(token.address, user_dst, amount).transact({"from": user_src})
+            submitted[("wrap", amount)] = time.perf_counter()
+            done_deposits += 1
+        # unwraps can only start once the user holds wrapped tokens on the destination
+        for _ in range(min(batch, unwraps - done_unwraps) if relayed else 0):
+            amount = 10 ** 15 + done_unwraps
+            destination.functions.unwrap(env["wrapped"], user_src, amount).transact({"from": user_dst})
+            submitted[("withdraw", amount)] = time.perf_counter()
+            done_unwraps += 1
+
+        t0 = time.perf_counter()
+        bridge.scan_blocks("source", env["contract_info"])
+        bridge.scan_blocks("destination", env["contract_info"])
+        now = time.perf_counter()
+        bridge_time += now - t0
+
+        wraps = relayed_events(dst_w3, destination.address, wrap_topic, dst_start)
+        withdrawals = relayed_events(src_w3, source.address, withdraw_topic, src_start)
+        for ev in wraps[seen_wraps:]:
+            relayed[("wrap", ev.amount)] = (now, ev.transactionHash)
+        for ev in withdrawals[seen_withdrawals:]:
+            relayed[("withdraw", ev.amount)] = (now, ev.transactionHash)
+        seen_wraps, seen_withdrawals = len(wraps), len(withdrawals)
+
+        if done_deposits == deposits and done_unwraps == unwraps and len(relayed) == deposits + unwraps:
+            break
+    elapsed = time.perf_counter() - started
+
+    # the metrics only see the bridge's connections, not the load generator's
+    bridge_calls = {"source": method_calls(src_metrics), "destination": method_calls(dst_metrics)}
+    rpc = {chain: dict(calls) for chain, calls in bridge_calls.items()}
+    rpc_total = sum(sum(calls.values()) for calls in bridge_calls.values())
+
+    gas = []
+    for (kind, _), (_, tx_hash) in relayed.items():
+        w3 = dst_w3 if kind == "wrap" else src_w3
+        gas.append(w3.eth.get_transaction_receipt(tx_hash).gasUsed)
+
+    latencies = [relayed[k][0] - submitted[k] for k in relayed if k in submitted]
+    n = len(relayed)
+    return {
+        "events": n,
+        "missing": deposits + unwraps - n,
+        "elapsed_s": elapsed,
+        "bridge_s": bridge_time,
+        "events_per_s": n / bridge_time if bridge_time else float("nan"),
+        "latency_p50_ms": 1000 * percentile(latencies, 50),
+        "latency_p90_ms": 1000 * percentile(latencies, 90),
+        "latency_p99_ms": 1000 * percentile(latencies, 99),
+        "rpc_calls_per_event": rpc_total / n if n else float("nan"),
+        "gas_per_relay": sum(gas) / len(gas) if gas else float("nan"),
+        "rpc_calls": rpc,
+        "rpc_rate": env["rpc_rate"],
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--deposits", type=int, default=100)
+    parser.add_argument("--unwraps", type=int, default=50)
+    parser.add_argument("--batch", type=int, default=10, help="events generated between two bridge runs")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    parser.add_argument("--rpc-rate", type=float, help=f"scheduler requests/second per chain (default {rpc_scheduler.DEFAULT_RATE:g}, "
+                                                         "which caps the relay rate)")
+    parser.add_argument("--max-p99", type=float, help="fail if p99 relay latency (ms) exceeds this")
+    parser.add_argument("--min-eps", type=float, help="fail if relayed events/second falls below this")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        env = setup(workdir, args.rpc_rate)
+        report = run(env, args.deposits, args.unwraps, args.batch)
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        for k, v in report.items():
+            print( f"{k:>22}: {v:.2f}" if isinstance(v, float) else f"{k:>22}: {v}" )
+
+    failed = report["missing"] > 0
+    if args.max_p99 is not None and report["latency_p99_ms"] > args.max_p99:
+        failed = True
+    if args.min_eps is not None and report["events_per_s"] < args.min_eps:
+        failed = True
+    sys.exit(1 if failed else 0)
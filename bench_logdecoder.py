@@ -0,0 +1,94 @@
+"""
+    Benchmark of logdecoder against web3's contract event processing on synthetic logs
+
+    python bench_logdecoder.py [num_logs]
+"""
+import json
+import os
+import sys
+import time
+
+import logdecoder
+
+
+def synthetic_logs(n, address="0xce425afb7b4f6dbc5522078d365182119c5e6f73"):
+    """
+        Builds n raw eth_getLogs entries alternating Deposit and Unwrap events
+    """
+    deposit = logdecoder.KNOWN_TOPICS["Deposit(address,address,uint256)"]
+    unwrap = logdecoder.KNOWN_TOPICS["Unwrap(address,address,address,address,uint256)"]
+
+    def word(b):
+        return "0x" + b.hex().rjust(64, "0")
+
+    logs = []
+    for i in range(n):
+        a, b, c = os.urandom(20), os.urandom(20), os.urandom(20)
+        amount = int.from_bytes(os.urandom(12), "big")
+        if i % 2 == 0:
+            topics = [deposit, word(a), word(b)]
+            data = "0x" + amount.to_bytes(32, "big").hex()
+        else:
+            topics = [unwrap, word(a), word(b), word(c)]
+            data = "0x" + os.urandom(20).hex().rjust(64, "0") + amount.to_bytes(32, "big").hex()
+        logs.append({
+            "address": address,
+            "topics": topics,
+            "data": data,
+            "blockNumber": hex(1_000_000 + i // 10),
+            "blockHash": "0x" + os.urandom(32).hex(),
+            "transactionHash": "0x" + os.urandom(32).hex(),
+            "transactionIndex": hex(i % 10),
+            "logIndex": hex(i % 10),
+            "removed": False,
+        })
+    return logs
+
+
+def bench_fast(logs):
+    start = time.perf_counter()
+    records = logdecoder.decode_logs(logs)
+    elapsed = time.perf_counter() - start
+    assert len(records) == len(logs)
+    return elapsed
+
+
+def bench_web3(logs, contract_info="contract_info.json"):
+    """
+        Times the path listener.py and bridge.py used before: eth_getLogs result
+        formatting followed by ContractEvent.process_log for every log
+    """
+    from web3 import Web3
+    from web3._utils.method_formatters import log_entry_formatter
+
+    with open(contract_info, "r") as f:
+        contracts = json.load(f)
+    w3 = Web3()
+    src = w3.eth.contract(abi=contracts["source"]["abi"])
+    dst = w3.eth.contract(abi=contracts["destination"]["abi"])
+    deposit = logdecoder.KNOWN_TOPICS["Deposit(address,address,uint256)"]
+
+    start = time.perf_counter()
+    for log in logs:
+        entry = log_entry_formatter(log)
+        if log["topics"][0] == deposit:
+            src.events.Deposit().process_log(entry)
+        else:
+            dst.events.Unwrap().process_log(entry)
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 20_000
+    logs = synthetic_logs(n)
+
+    fast = bench_fast(logs)
+    print( f"logdecoder: {n} logs in {fast:.3f}s ({n / fast:,.0f} logs/s)" )
+
+    try:
+        slow = bench_web3(logs)
+    except ImportError as e:
+        print( f"web3 not available, skipping the baseline ({e})" )
+    else:
+        print( f"web3:       {n} logs in {slow:.3f}s ({n / slow:,.0f} logs/s)" )
+        print( f"speedup:    {slow / fast:.1f}x" )
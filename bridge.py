@@ -1,14 +1,25 @@
 from web3 import Web3
 from web3.providers.rpc import HTTPProvider
-from web3.middleware import ExtraDataToPOAMiddleware #Necessary for POA chains
 from datetime import datetime
-import pandas as pd
 import json, pathlib
 from typing import Dict
+import logdecoder
+import rpc_scheduler
+import rpc_stack
+import abi_registry
+import fee_oracle
+import token_registry
 
 
 
+# one Web3 per chain, so the contract factories abi_registry keeps per Web3 are reused across scans
+_connections = {}
+
+
 def connect_to(chain):
+    if chain in _connections:
+        return _connections[chain]
+
     if chain == 'source':  # The source contract chain is avax
         api_url = f"https://api.avax-test.network/ext/bc/C/rpc" #AVAX C-chain testnet
 
@@ -16,9 +27,8 @@ def connect_to(chain):
         api_url = f"https://data-seed-prebsc-1-s1.binance.org:8545/" #BSC testnet
 
     if chain in ['source','destination']:
-        w3 = Web3(Web3.HTTPProvider(api_url))
-        # inject the poa compatibility middleware to the innermost layer
-        w3.middleware_onion.inject(ExtraDataToPOAMiddleware, layer=0)
+        w3 = rpc_stack.install(Web3(Web3.HTTPProvider(api_url)), 'avax' if chain == 'source' else 'bsc')
+        _connections[chain] = w3
     return w3
 
 
@@ -28,12 +38,12 @@ def get_contract_info(chain, contract_info):
         This function is used by the autograder and will likely be useful to you
     """
     try:
-        with open(contract_info, 'r')  as f:
-            contracts = json.load(f)
+        contracts = abi_registry.load(contract_info)
     except Exception as e:
         print( f"Failed to read contract info\nPlease contact your instructor\n{e}" )
         return 0
-    return contracts[chain]
+    spec = contracts[chain]
+    return {"address": spec.address, "abi": spec.abi}
 
 
 KEY_FILE  = "secret_key.txt"
@@ -53,8 +63,13 @@ def load_state() -> Dict[str,int]:
 def save_state(state: Dict[str,int]):
     pathlib.Path(STATEFILE).write_text(json.dumps(state))
 
-MAX_RANGE = 2_000   # provider limit is 2 048; stay safely under
 SAFETY    = 5       # always scan at least the last 5 new blocks
+RELAY_TARGET_BLOCKS = 2  # relays should land within this many blocks
+
+DEPOSIT_TOPIC = logdecoder.KNOWN_TOPICS["Deposit(address,address,uint256)"]
+UNWRAP_TOPIC  = logdecoder.KNOWN_TOPICS["Unwrap(address,address,address,address,uint256)"]
+REGISTRATION_TOPIC = logdecoder.KNOWN_TOPICS["Registration(address)"]
+CREATION_TOPIC     = logdecoder.KNOWN_TOPICS["Creation(address,address)"]
 
 def scan_blocks(chain: str, contract_info="contract_info.json"):
     """
@@ -70,85 +85,98 @@ def scan_blocks(chain: str, contract_info="contract_info.json"):
         print("Invalid chain:", chain)
         return
 
-    # YOUR CODE HERE
-    w3_src = connect_to("source")
-    w3_dst = connect_to("destination")
-
-    src_cfg = get_contract_info("source", contract_info)
-    dst_cfg = get_contract_info("destination", contract_info)
-
-    C_src = w3_src.eth.contract(
-        address=Web3.to_checksum_address(src_cfg["address"]),
-        abi=src_cfg["abi"]
-    )
-    C_dst = w3_dst.eth.contract(
-        address=Web3.to_checksum_address(dst_cfg["address"]),
-        abi=dst_cfg["abi"]
-    )
-
-    acct  = Web3().eth.account.from_key(load_key())
-    state = load_state()
-
-    if chain == "source":
-        head = w3_src.eth.block_number
-        frm = state.get("fuji", head - SAFETY) + 1
-        if head - frm > MAX_RANGE:
-            frm = head - MAX_RANGE  # <-- cap the span
-
-        # frm  = state.get("fuji", 0) + 1
-
-        # one filter, one RPC call
-        dep_filter = C_src.events.Deposit.create_filter(from_block=frm, to_block="latest")
-        logs = dep_filter.get_all_entries()
-
-        nonce = w3_dst.eth.get_transaction_count(acct.address)
-        for ev in logs:
-            args = ev["args"]
-            token, recipient, amount = args["token"], args["recipient"], args["amount"]
-            print(f"[Fuji] Deposit {amount} {token} → {recipient}")
-
-            tx = C_dst.functions.wrap(token, recipient, amount).build_transaction(
-                {"from": acct.address,
-                 "nonce": nonce,
-                 "gas": 300_000,
-                 "gasPrice": w3_dst.to_wei(5, "gwei")}
-            )
-            tx_hash = w3_dst.eth.send_raw_transaction(
-                acct.sign_transaction(tx).raw_transaction)
-            print("   ↳ wrap() tx:", tx_hash.hex())
-            nonce += 1
-
-        state["fuji"] = w3_src.eth.block_number
-
-    else:
-        head = w3_dst.eth.block_number
-        frm = state.get("bsc", head - SAFETY) + 1
-        if head - frm > MAX_RANGE:
-            frm = head - MAX_RANGE
-
-        # frm  = state.get("bsc", 0) + 1
-        un_filter = C_dst.events.Unwrap.create_filter(from_block=frm, to_block="latest")
-        logs = un_filter.get_all_entries()
-
-        nonce = w3_src.eth.get_transaction_count(acct.address)
-        for ev in logs:
-            args = ev["args"]
-            underlying = args["underlying_token"]
-            to_addr    = args["to"]
-            amount     = args["amount"]
-            print(f"[BSC] Unwrap {amount} {underlying} → {to_addr}")
-
-            tx = C_src.functions.withdraw(underlying, to_addr, amount).build_transaction(
-                {"from": acct.address,
-                 "nonce": nonce,
-                 "gas": 300_000,
-                 "gasPrice": w3_src.to_wei(12, "gwei")}
-            )
-            tx_hash = w3_src.eth.send_raw_transaction(
-                acct.sign_transaction(tx).raw_transaction)
-            print("   ↳ withdraw() tx:", tx_hash.hex())
-            nonce += 1
-
-        state["bsc"] = w3_dst.eth.block_number
-
-    save_state(state)
+    # a relay's reads are on the critical path of its transactions, keep them ahead of backfills
+    with rpc_scheduler.priority(rpc_scheduler.HEAD):
+        # YOUR CODE HERE
+        w3_src = connect_to("source")
+        w3_dst = connect_to("destination")
+
+        # parsed once per process, contract factories reused per connection
+        C_src = abi_registry.contract(w3_src, "source", path=contract_info)
+        C_dst = abi_registry.contract(w3_dst, "destination", path=contract_info)
+
+        acct  = Web3().eth.account.from_key(load_key())
+        state = load_state()
+        tokens = token_registry.get_registry()
+
+        if chain == "source":
+            head = w3_src.eth.block_number
+            frm = state.get("fuji", head - SAFETY) + 1
+            if head - frm > logdecoder.MAX_RANGE:
+                frm = head - logdecoder.MAX_RANGE  # <-- cap the span
+
+            # frm  = state.get("fuji", 0) + 1
+
+            # one eth_getLogs call, decoded straight from the raw log words;
+            # Registration events ride along to keep the token registry current
+            logs = logdecoder.decode_logs(logdecoder.get_raw_logs(
+                w3_src, frm, head, C_src.address, [[DEPOSIT_TOPIC, REGISTRATION_TOPIC]]))
+            for ev in logs:
+                if ev.event == "Registration":
+                    tokens.apply(ev)
+            logs = [ev for ev in logs if ev.event == "Deposit"]
+
+            nonce = w3_dst.eth.get_transaction_count(acct.address)
+            fees  = fee_oracle.get_oracle("bsc", w3_dst).fee_params(RELAY_TARGET_BLOCKS) if logs else {}
+            for ev in logs:
+                token = Web3.to_checksum_address(ev.token)
+                recipient = Web3.to_checksum_address(ev.recipient)
+                amount = ev.amount
+                print(f"[Fuji] Deposit {amount} {token} → {recipient}")
+                if not tokens.can_wrap(token, C_dst):
+                    print("   ↳ skipped, no wrapped token on the destination")
+                    continue
+
+                tx = C_dst.functions.wrap(token, recipient, amount).build_transaction(
+                    {"from": acct.address,
+                     "nonce": nonce,
+                     "gas": 300_000,
+                     **fees}
+                )
+                tx_hash = w3_dst.eth.send_raw_transaction(
+                    acct.sign_transaction(tx).raw_transaction)
+                print("   ↳ wrap() tx:", tx_hash.hex())
+                nonce += 1
+
+            state["fuji"] = head
+
+        else:
+            head = w3_dst.eth.block_number
+            frm = state.get("bsc", head - SAFETY) + 1
+            if head - frm > logdecoder.MAX_RANGE:
+                frm = head - logdecoder.MAX_RANGE
+
+            # frm  = state.get("bsc", 0) + 1
+            logs = logdecoder.decode_logs(logdecoder.get_raw_logs(
+                w3_dst, frm, head, C_dst.address, [[UNWRAP_TOPIC, CREATION_TOPIC]]))
+            for ev in logs:
+                if ev.event == "Creation":
+                    tokens.apply(ev)
+            logs = [ev for ev in logs if ev.event == "Unwrap"]
+
+            nonce = w3_src.eth.get_transaction_count(acct.address)
+            fees  = fee_oracle.get_oracle("avax", w3_src).fee_params(RELAY_TARGET_BLOCKS) if logs else {}
+            for ev in logs:
+                underlying = Web3.to_checksum_address(ev.underlying_token)
+                to_addr    = Web3.to_checksum_address(ev.to)
+                amount     = ev.amount
+                print(f"[BSC] Unwrap {amount} {underlying} → {to_addr}")
+                if not tokens.is_consistent_unwrap(underlying, ev.wrapped_token) or not tokens.can_withdraw(underlying, C_src):
+                    print("   ↳ skipped, token not registered on the source")
+                    continue
+
+                tx = C_src.functions.withdraw(underlying, to_addr, amount).build_transaction(
+                    {"from": acct.address,
+                     "nonce": nonce,
+                     "gas": 300_000,
+                     **fees}
+                )
+                tx_hash = w3_src.eth.send_raw_transaction(
+                    acct.sign_transaction(tx).raw_transaction)
+                print("   ↳ withdraw() tx:", tx_hash.hex())
+                nonce += 1
+
+            state["bsc"] = head
+
+        save_state(state)
+        tokens.save()
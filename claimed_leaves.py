@@ -0,0 +1,162 @@
+"""
+    Local index of the Merkle leaves (primes) that have already been claimed
+
+    submitProof.merkle_assignment used to pick a random leaf and find out on
+    chain, after paying gas, whether somebody had claimed it first.  This index
+    keeps one bit per leaf, filled from the Merkle contract's history: every log
+    the contract emitted points at a claiming transaction, whose sender is
+    looked up with getPrimeByOwner.  Transactions and calls are fetched in JSON-RPC
+    batches, and the scan resumes from the last block seen, so keeping the index
+    current costs a handful of requests.
+
+    The first update only looks INITIAL_LOOKBACK blocks back, so claims older
+    than that are missing until they are found another way: the index is a
+    filter that avoids most taken leaves, not proof that a leaf is free.
+    submitProof confirms its pick with an eth_call of submit() and marks the
+    leaves that turn out to be taken.
+
+        index = ClaimedLeaves(primes)
+        index.update(w3, contract)
+        leaf = index.pick_unclaimed()
+"""
+import json
+import os
+import random
+
+import logdecoder
+
+NUM_LEAVES = 8192
+STATE_FILE = ".claimed_leaves.json"
+BATCH_SIZE = 100           # requests per JSON-RPC batch
+INITIAL_LOOKBACK = 50_000  # blocks scanned on the first update when no start block is given
+
+
+class ClaimedLeaves:
+    """
+        Bitmap over the leaves, bit i set when primes[i] has been claimed
+    """
+
+    def __init__(self, primes, path=STATE_FILE):
+        self.index_of = {p: i for i, p in enumerate(primes)}
+        self.bits = bytearray((len(primes) + 7) // 8)
+        self.skipped = bytearray(len(self.bits))  # passed over this run only, never saved
+        self.size = len(primes)
+        self.path = path
+        self.last_block = None
+        self.mark(0)  # leaf 0 is claimed by the contract deployer
+        if path and os.path.exists(path):
+            self.load()
+
+    def mark(self, i):
+        self.bits[i >> 3] |= 1 << (i & 7)
+
+    def mark_prime(self, prime):
+        i = self.index_of.get(prime)
+        if i is not None:
+            self.mark(i)
+        return i
+
+    def skip(self, i):
+        """
+            Leaves leaf i out of pick_unclaimed for the rest of the run without marking it claimed
+        """
+        self.skipped[i >> 3] |= 1 << (i & 7)
+
+    def is_claimed(self, i):
+        return bool(self.bits[i >> 3] & (1 << (i & 7)))
+
+    def claimed_count(self):
+        return sum(bin(b).count("1") for b in self.bits)
+
+    def pick_unclaimed(self, rng=random):
+        """
+            Returns a random unclaimed leaf index, or None when every leaf is taken
+
+            Starts at a random byte and walks to the first byte with a free bit,
+            so a pick touches a few bytes rather than all 8192 leaves.
+        """
+        n = len(self.bits)
+        start = rng.randrange(n)
+        for k in range(n):
+            j = (start + k) % n
+            free = ~(self.bits[j] | self.skipped[j]) & 0xff
+            if j == n - 1 and self.size % 8:
+                free &= (1 << (self.size % 8)) - 1
+            if free:
+                choices = [b for b in range(8) if free & (1 << b)]
+                return j * 8 + rng.choice(choices)
+        return None
+
+    def load(self):
+        with open(self.path, "r") as f:
+            state = json.load(f)
+        bits = bytes.fromhex(state["bitmap"])
+        if len(bits) == len(self.bits):
+            self.bits = bytearray(bits)
+            self.last_block = state.get("block")
+
+    def save(self):
+        if not self.path:
+            return
+        with open(self.path, "w") as f:
+            json.dump({"block": self.last_block, "bitmap": self.bits.hex()}, f)
+
+    def update(self, w3, contract, from_block=None, to_block=None):
+        """
+            Scans the contract's logs since the last update and marks the primes
+            now owned by the senders of those transactions.  Returns the number of
+            newly claimed leaves found.
+        """
+        if to_block is None:
+            to_block = w3.eth.block_number
+        if from_block is None:
+            if self.last_block is not None:
+                from_block = self.last_block + 1
+            else:
+                from_block = max(0, to_block - INITIAL_LOOKBACK)
+                print( f"No claimed-leaf history yet, scanning from block {from_block}" )
+        if from_block > to_block:
+            return 0
+
+        tx_hashes = []
+        seen = set()
+        for frm in range(from_block, to_block + 1, logdecoder.MAX_RANGE):
+            logs = w3.manager.request_blocking("eth_getLogs", [{
+                "fromBlock": hex(frm),
+                "toBlock": hex(min(frm + logdecoder.MAX_RANGE - 1, to_block)),
+                "address": contract.address,
+            }])
+            for log in logs:
+                h = log["transactionHash"]
+                if h not in seen:
+                    seen.add(h)
+                    tx_hashes.append(h)
+
+        owners = set()
+        for chunk in _chunks(tx_hashes, BATCH_SIZE):
+            with w3.batch_requests() as batch:
+                for h in chunk:
+                    batch.add(w3.eth.get_transaction(h))
+                for tx in batch.execute():
+                    owners.add(tx["from"])
+
+        before = self.claimed_count()
+        for chunk in _chunks(sorted(owners), BATCH_SIZE):
+            with w3.batch_requests() as batch:
+                for owner in chunk:
+                    batch.add(contract.functions.getPrimeByOwner(owner))
+                for prime in batch.execute():
+                    # a bytes32 ABI hands back the leaf itself, zero means the owner has none
+                    if isinstance(prime, (bytes, bytearray)):
+                        prime = int.from_bytes(prime, "big")
+                    if prime:
+                        self.mark_prime(prime)
+
+        self.last_block = to_block
+        self.save()
+        return self.claimed_count() - before
+
+
+def _chunks(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
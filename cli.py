@@ -0,0 +1,196 @@
+"""
+    Single entry point for the scripts in this repo
+
+        python cli.py relay source|destination
+        python cli.py listen avax|bsc [--from N] [--to N|latest] [--follow]
+        python cli.py mint [--keys mint_keys.txt --count 100]
+        python cli.py reconcile
+        python cli.py ape-info 2
+        python cli.py prove
+        python cli.py mine [--difficulty 20] [--blocks 10 --chain chain.bin]
+        python cli.py validate-chain chain.bin
+
+    Only argparse is imported up front.  Each subcommand imports the module it
+    needs (and through it web3, pandas, requests) when it runs, and no network
+    connection is made before that.  --profile-imports prints how long each
+    first-time import took, slowest first, after the command finishes.
+"""
+import argparse
+import sys
+import time
+
+
+class ImportProfiler:
+    """
+        Times every first import of a module while installed (inclusive of its own imports)
+    """
+
+    def __init__(self):
+        self.timings = []  # (seconds, depth, module name) in completion order
+        self._depth = 0
+        self._orig_import = None
+
+    def install(self):
+        import builtins
+
+        self._orig_import = builtins.__import__
+
+        def timed_import(name, globals=None, locals=None, fromlist=(), level=0):
+            if level or name in sys.modules:
+                return self._orig_import(name, globals, locals, fromlist, level)
+            self._depth += 1
+            start = time.perf_counter()
+            try:
+                return self._orig_import(name, globals, locals, fromlist, level)
+            finally:
+                self._depth -= 1
+                self.timings.append((time.perf_counter() - start, self._depth, name))
+
+        builtins.__import__ = timed_import
+
+    def uninstall(self):
+        import builtins
+
+        if self._orig_import is not None:
+            builtins.__import__ = self._orig_import
+
+    def report(self, limit=25):
+        top = sorted((t for t in self.timings if t[1] == 0), reverse=True)
+        total = sum(t for t, _, _ in top)
+        lines = [f"import time: {1000 * total:.1f} ms in {len(self.timings)} modules, top-level imports:"]
+        for seconds, _, name in top[:limit]:
+            lines.append(f"{1000 * seconds:>10.1f} ms  {name}")
+        return "\n".join(lines)
+
+
+def cmd_relay(args):
+    import bridge
+    bridge.scan_blocks(args.chain, args.contract_info)
+
+
+def cmd_listen(args):
+    import listener
+    if args.follow:
+        listener.listen(args.chain, confirmations=args.confirmations, contract_info=args.contract_info)
+    else:
+        start = args.start if args.start == "latest" else int(args.start)
+        end = args.end if args.end == "latest" else int(args.end)
+        listener.scan_events(args.chain, start, end, contract_info=args.contract_info)
+
+
+def cmd_mint(args):
+    import mint
+    if args.keys:
+        mint.claim_batch(mint.load_keys(args.keys), args.count)
+        return
+    tx_hash = mint.claim()
+    print( f"Tx sent {tx_hash.hex()} → wait ~5 s then check SnowTrace" )
+
+
+def cmd_reconcile(args):
+    import reconcile
+    reconcile.print_report(reconcile.reconcile(args.contract_info, args.erc20s))
+
+
+def cmd_ape_info(args):
+    import get_ape_info
+    print(get_ape_info.get_ape_info(args.ape_id))
+
+
+def cmd_prove(args):
+    import submitProof
+    submitProof.merkle_assignment()
+
+
+def cmd_mine(args):
+    import hashlib
+    import findBlockNonce
+
+    if args.chain:
+        import powchain
+        powchain.mine(args.chain, args.blocks, args.difficulty, args.lines, args.transactions_file)
+        return
+
+    transactions = findBlockNonce.get_random_lines(args.transactions_file, args.lines)
+    prev_hash = hashlib.sha256(b"genesis").digest()
+    start = time.perf_counter()
+    nonce = findBlockNonce.mine_block(args.difficulty, prev_hash, transactions)
+    print( f"nonce {nonce} found in {time.perf_counter() - start:.2f}s" )
+
+
+def cmd_validate_chain(args):
+    import powchain
+    start = time.perf_counter()
+    bad = powchain.validate(args.path, args.min_difficulty, args.workers)
+    took = time.perf_counter() - start
+    print( f"chain valid ({took:.2f}s)" if not bad else f"invalid blocks at heights {bad} ({took:.2f}s)" )
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="EAS-583 bridge, NFT and Merkle tools")
+    parser.add_argument("--profile-imports", action="store_true", help="report import times when done")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("relay", help="relay bridge events once (bridge.scan_blocks)")
+    p.add_argument("chain", choices=["source", "destination"])
+    p.add_argument("--contract-info", default="contract_info.json")
+    p.set_defaults(func=cmd_relay)
+
+    p = sub.add_parser("listen", help="scan or follow bridge events")
+    p.add_argument("chain", choices=["avax", "bsc"])
+    p.add_argument("--from", dest="start", default="latest")
+    p.add_argument("--to", dest="end", default="latest")
+    p.add_argument("--follow", action="store_true", help="keep listening for new blocks")
+    p.add_argument("--confirmations", type=int, default=1)
+    p.add_argument("--contract-info", default="contract_info.json")
+    p.set_defaults(func=cmd_listen)
+
+    p = sub.add_parser("mint", help="claim NFTs (mint.py)")
+    p.add_argument("--keys", help="file of funded private keys, enables the sharded batch runner")
+    p.add_argument("--count", type=int, default=1, help="claims to make with --keys")
+    p.set_defaults(func=cmd_mint)
+
+    p = sub.add_parser("reconcile", help="check locked tokens against wrapped supply (reconcile.py)")
+    p.add_argument("--contract-info", default="contract_info.json")
+    p.add_argument("--erc20s", default="erc20s.csv")
+    p.set_defaults(func=cmd_reconcile)
+
+    p = sub.add_parser("ape-info", help="owner, image and eyes of a BAYC token")
+    p.add_argument("ape_id", type=int)
+    p.set_defaults(func=cmd_ape_info)
+
+    p = sub.add_parser("prove", help="claim a prime with a Merkle proof (submitProof.py)")
+    p.set_defaults(func=cmd_prove)
+
+    p = sub.add_parser("mine", help="find a block nonce (findBlockNonce.py)")
+    p.add_argument("--difficulty", type=int, default=20)
+    p.add_argument("--lines", type=int, default=10)
+    p.add_argument("--transactions-file", default="bitcoin_text.txt")
+    p.add_argument("--chain", help="append mined blocks to this chain file (powchain.py)")
+    p.add_argument("--blocks", type=int, default=1, help="blocks to mine with --chain")
+    p.set_defaults(func=cmd_mine)
+
+    p = sub.add_parser("validate-chain", help="check a powchain file in parallel")
+    p.add_argument("path")
+    p.add_argument("--min-difficulty", type=int, default=0)
+    p.add_argument("--workers", type=int, default=None)
+    p.set_defaults(func=cmd_validate_chain)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    profiler = None
+    if args.profile_imports:
+        profiler = ImportProfiler()
+        profiler.install()
+    try:
+        args.func(args)
+    finally:
+        if profiler is not None:
+            profiler.uninstall()
+            print(profiler.report(), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
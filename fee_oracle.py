@@ -0,0 +1,110 @@
+"""
+    Per-chain fee oracle built on eth_feeHistory
+
+    One eth_feeHistory call per refresh interval returns the base fee of the
+    last 'window' blocks (plus the next one) and the priority fees paid at a few
+    percentiles.  Transaction builders then ask for fees from memory:
+
+        fees = fee_oracle.get_oracle("avax", w3).fee_params(target_blocks=2)
+        tx = contract.functions.f().build_transaction({"from": addr, "nonce": n, **fees})
+
+    On chains that report a zero base fee (BSC) a legacy gasPrice is returned,
+    elsewhere EIP-1559 maxFeePerGas / maxPriorityFeePerGas.
+"""
+import threading
+import time
+
+GWEI = 10 ** 9
+
+# lowest gas price / priority fee each chain's nodes will accept into their pool
+MIN_PRIORITY_FEE = {
+    'avax': 1,
+    'bsc': 1 * GWEI,
+    'eth': 1,
+}
+
+# reward percentile used for a target inclusion delay (in blocks)
+TARGET_PERCENTILES = ((1, 90), (3, 50), (None, 10))
+
+
+class FeeOracle:
+    """
+        Rolling window of base fees and priority-fee percentiles for one chain
+    """
+
+    def __init__(self, w3, window=20, percentiles=(10, 50, 90), refresh_interval=15.0, min_priority_fee=1):
+        self.w3 = w3
+        self.window = window
+        self.percentiles = tuple(percentiles)
+        self.refresh_interval = refresh_interval
+        self.min_priority_fee = min_priority_fee
+        self.base_fees = []   # base fee of each block in the window, then the next block's
+        self.rewards = []     # per block, priority fee paid at each percentile
+        self.gas_price = None # only set when the node has no eth_feeHistory
+        self.updated = 0.0
+        self._lock = threading.Lock()
+
+    def refresh(self, force=False):
+        """
+            Samples eth_feeHistory once if the last sample is older than refresh_interval
+        """
+        with self._lock:
+            if not force and time.monotonic() - self.updated < self.refresh_interval:
+                return
+            try:
+                hist = self.w3.eth.fee_history(self.window, "latest", list(self.percentiles))
+                self.base_fees = [int(b) for b in hist["baseFeePerGas"]]
+                self.rewards = [[int(r) for r in block] for block in hist.get("reward") or []]
+                self.gas_price = None
+            except Exception as e:
+                print( f"eth_feeHistory unavailable ({e}), falling back to eth_gasPrice" )
+                self.base_fees, self.rewards = [], []
+                self.gas_price = self.w3.eth.gas_price
+            self.updated = time.monotonic()
+
+    def priority_fee(self, target_blocks):
+        """
+            Median over the window of the reward percentile matching target_blocks
+        """
+        pct = next(p for limit, p in TARGET_PERCENTILES if limit is None or target_blocks <= limit)
+        if pct not in self.percentiles:
+            pct = min(self.percentiles, key=lambda p: abs(p - pct))
+        col = self.percentiles.index(pct)
+        samples = sorted(block[col] for block in self.rewards if block)
+        tip = samples[len(samples) // 2] if samples else 0
+        return max(tip, self.min_priority_fee)
+
+    def fee_params(self, target_blocks=3):
+        """
+            Returns the fee fields of a transaction meant to be included within target_blocks blocks
+        """
+        self.refresh()
+        if self.gas_price is not None:
+            return {"gasPrice": max(self.gas_price, self.min_priority_fee)}
+
+        tip = self.priority_fee(target_blocks)
+        next_base = self.base_fees[-1] if self.base_fees else 0
+        if next_base == 0:
+            return {"gasPrice": tip}
+
+        # the base fee can rise by at most 12.5% per block, cover that for every block we may wait
+        max_base = next_base * 9 ** target_blocks // 8 ** target_blocks + 1
+        return {"maxFeePerGas": max_base + tip, "maxPriorityFeePerGas": tip}
+
+
+_oracles = {}
+_oracles_lock = threading.Lock()
+
+
+def get_oracle(chain, w3, **kwargs):
+    """
+        Returns the process-wide oracle for 'chain', pointing it at w3 (the newest connection)
+    """
+    with _oracles_lock:
+        oracle = _oracles.get(chain)
+        if oracle is None:
+            kwargs.setdefault("min_priority_fee", MIN_PRIORITY_FEE.get(chain, 1))
+            oracle = _oracles[chain] = FeeOracle(w3, **kwargs)
+        else:
+            oracle.w3 = w3
+        return oracle
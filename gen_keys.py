@@ -35,8 +35,126 @@ def sign_message(challenge, filename="secret_key.txt"):
     return signed_message, eth_addr
 
 
+
+
+# scrypt work factor for test keystores, geth's default (2**18) takes ~1s per key
+FAST_SCRYPT_N = 2 ** 10
+# every vanity character multiplies the search by 16, 8 is already ~4 billion tries per account
+MAX_PREFIX_LEN = 8
+
+
+def _generate_chunk(count, prefix):
+    """
+        Worker: creates 'count' accounts whose address starts with 'prefix'
+        (lowercase hex, without 0x).  Returns a list of (address, private key hex).
+    """
+    from eth_account import Account
+
+    found = []
+    while len(found) < count:
+        acct = Account.create()
+        if acct.address[2:].lower().startswith(prefix):
+            found.append((acct.address, acct.key.hex()))
+    return found
+
+
+def _encrypt_key(args):
+    """
+        Worker: encrypts one private key into a keystore (v3 JSON) dict
+    """
+    from eth_account import Account
+
+    key, password, scrypt_n = args
+    return Account.encrypt(key, password, kdf="scrypt", iterations=scrypt_n)
+
+
+def generate_accounts(n, prefix="", workers=None, chunk_size=64):
+    """
+        Creates n accounts across a process pool, returns a list of (address, private key hex)
+
+        With a vanity 'prefix' every account's address starts with it (each extra
+        hex character makes the search ~16x longer).  A prefix that no address can
+        start with, or one longer than MAX_PREFIX_LEN, raises ValueError.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    prefix = prefix.lower()
+    if prefix.startswith("0x"):
+        prefix = prefix[2:]
+    if any(c not in "0123456789abcdef" for c in prefix):
+        raise ValueError(f"vanity prefix {prefix!r} is not hex")
+    if len(prefix) > MAX_PREFIX_LEN:
+        raise ValueError(f"vanity prefix {prefix!r} is longer than {MAX_PREFIX_LEN} characters")
+
+    chunks = [min(chunk_size, n - i) for i in range(0, n, chunk_size)]
+    accounts = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_generate_chunk, size, prefix) for size in chunks]
+        for fut in futures:
+            accounts.extend(fut.result())
+    return accounts
+
+
+def export_keystores(accounts, directory, password, scrypt_n=FAST_SCRYPT_N, workers=None):
+    """
+        Writes one encrypted keystore file per account into 'directory' (encryption
+        runs across a process pool), returns the list of file paths
+    """
+    import json
+    from concurrent.futures import ProcessPoolExecutor
+
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        jobs = [(key, password, scrypt_n) for _, key in accounts]
+        for (address, _), keystore in zip(accounts, pool.map(_encrypt_key, jobs, chunksize=16)):
+            path = os.path.join(directory, f"UTC--{address}.json")
+            with open(path, "w") as f:
+                json.dump(keystore, f)
+            paths.append(path)
+    return paths
+
+
+def load_keystores(directory, password):
+    """
+        Decrypts every keystore in 'directory', returns a list of private keys (hex)
+    """
+    import json
+
+    keys = []
+    for name in sorted(os.listdir(directory)):
+        if name.endswith(".json"):
+            with open(os.path.join(directory, name), "r") as f:
+                keys.append("0x" + bytes(eth_account.Account.decrypt(json.load(f), password)).hex())
+    return keys
+
+
 if __name__ == "__main__":
-    for i in range(4):
-        challenge = os.urandom(64)
-        sig, addr= sign_message(challenge=challenge)
-        print( addr )
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Sign test challenges, or bulk-generate test accounts")
+    parser.add_argument("--bulk", type=int, help="number of accounts to generate")
+    parser.add_argument("--prefix", default="", help="vanity address prefix (hex, without 0x)")
+    parser.add_argument("--out", default="keystores", help="keystore directory")
+    parser.add_argument("--password", default="test")
+    parser.add_argument("--scrypt-n", type=int, default=FAST_SCRYPT_N)
+    parser.add_argument("--workers", type=int)
+    args = parser.parse_args()
+
+    if args.bulk:
+        import time
+
+        start = time.perf_counter()
+        try:
+            accounts = generate_accounts(args.bulk, args.prefix, args.workers)
+        except ValueError as e:
+            parser.error(str(e))
+        generated = time.perf_counter()
+        paths = export_keystores(accounts, args.out, args.password, args.scrypt_n, args.workers)
+        print( f"{len(accounts)} accounts in {generated - start:.1f}s, "
+               f"{len(paths)} keystores written to {args.out} in {time.perf_counter() - generated:.1f}s" )
+    else:
+        for i in range(4):
+            challenge = os.urandom(64)
+            sig, addr= sign_message(challenge=challenge)
+            print( addr )
@@ -1,25 +1,33 @@
-from web3 import Web3
-from web3.providers.rpc import HTTPProvider
-import requests
-import json
+import rpc_stack
+import abi_registry
 
 bayc_address = "0xBC4CA0EdA7647A8aB7C2061c2E118A18a936f13D"
-contract_address = Web3.to_checksum_address(bayc_address)
+contract_address = bayc_address  # already checksummed
 
 # You will need the ABI to connect to the contract
 # The file 'abi.json' has the ABI for the bored ape contract
 # In general, you can get contract ABIs from etherscan
 # https://api.etherscan.io/api?module=contract&action=getabi&address=0xBC4CA0EdA7647A8aB7C2061c2E118A18a936f13D
-with open('ape_abi.json', 'r') as f:
-    abi = json.load(f)
+# The ABI is parsed once and cached by abi_registry
 
 ############################
 # Connect to an Ethereum node
 api_url = "https://eth-mainnet.g.alchemy.com/v2/9Ue9e6LZjqj97g0Fa3cKM5msj4nGPp-6"  # YOU WILL NEED TO PROVIDE THE URL OF AN ETHEREUM NODE
-provider = HTTPProvider(api_url)
-web3 = Web3(provider)
 
-contract = web3.eth.contract(address=contract_address, abi=abi)
+# The connection and contract are created on the first call, not at import
+_contract = None
+
+
+def get_contract():
+    global _contract
+    if _contract is None:
+        from web3 import Web3
+        from web3.providers.rpc import HTTPProvider
+
+        web3 = rpc_stack.install(Web3(HTTPProvider(api_url)), 'eth')
+        _contract = abi_registry.contract(web3, "ape", address=contract_address, path='ape_abi.json')
+    return _contract
+
 
 def get_ape_info(ape_id):
     assert isinstance(ape_id, int), f"{ape_id} is not an int"
@@ -29,6 +37,9 @@ def get_ape_info(ape_id):
     data = {'owner': "", 'image': "", 'eyes': ""}
 
     # YOUR CODE HERE
+    import requests
+
+    contract = get_contract()
     owner = contract.functions.ownerOf(ape_id).call()
     tokenURI = contract.functions.tokenURI(ape_id).call()
 
@@ -1,10 +1,11 @@
 from web3 import Web3
 from web3.providers.rpc import HTTPProvider
-from web3.middleware import ExtraDataToPOAMiddleware #Necessary for POA chains
 from pathlib import Path
-import json
 from datetime import datetime
-import pandas as pd
+import logdecoder
+import rpc_scheduler
+import rpc_stack
+import abi_registry
 
 
 def scan_blocks(chain, start_block, end_block, contract_address, eventfile='deposit_logs.csv'):
@@ -23,17 +24,9 @@ def scan_blocks(chain, start_block, end_block, contract_address, eventfile='depo
     if chain == 'bsc':
         api_url = f"https://data-seed-prebsc-1-s1.binance.org:8545/" #BSC testnet
 
-    if chain in ['avax','bsc']:
-        w3 = Web3(Web3.HTTPProvider(api_url))
-        # inject the poa compatibility middleware to the innermost layer
-        w3.middleware_onion.inject(ExtraDataToPOAMiddleware, layer=0)
-    else:
-        w3 = Web3(Web3.HTTPProvider(api_url))
-
-    DEPOSIT_ABI = json.loads('[ { "anonymous": false, "inputs": [ { "indexed": true, "internalType": "address", "name": "token", "type": "address" }, { "indexed": true, "internalType": "address", "name": "recipient", "type": "address" }, { "indexed": false, "internalType": "uint256", "name": "amount", "type": "uint256" } ], "name": "Deposit", "type": "event" }]')
-    contract = w3.eth.contract(address=contract_address, abi=DEPOSIT_ABI)
+    w3 = rpc_stack.install(Web3(Web3.HTTPProvider(api_url)), chain)
 
-    arg_filter = {}
+    contract_address = Web3.to_checksum_address(contract_address)
 
     if start_block == "latest":
         start_block = w3.eth.get_block_number()
@@ -51,52 +44,437 @@ def scan_blocks(chain, start_block, end_block, contract_address, eventfile='depo
         print( f"Scanning blocks {start_block} - {end_block} on {chain}" )
 
     rows = []
-    if end_block - start_block < 30:
-        event_filter = contract.events.Deposit.create_filter(from_block=start_block,to_block=end_block,argument_filters=arg_filter)
-        events = event_filter.get_all_entries()
-        #print( f"Got {len(events)} entries for block {block_num}" )
-        # TODO YOUR CODE HERE
-        for evt in events:
-            blk_time = w3.eth.get_block(evt.blockNumber).timestamp
+    block_times = {}
+    deposit_topic = logdecoder.KNOWN_TOPICS["Deposit(address,address,uint256)"]
+    for frm in range(start_block, end_block + 1, logdecoder.MAX_RANGE):
+        to = min(frm + logdecoder.MAX_RANGE - 1, end_block)
+        logs = logdecoder.get_raw_logs(w3, frm, to, contract_address, [deposit_topic])
+        for evt in logdecoder.decode_logs(logs):
+            if evt.blockNumber not in block_times:
+                block_times[evt.blockNumber] = w3.eth.get_block(evt.blockNumber).timestamp
+            blk_time = block_times[evt.blockNumber]
             rows.append(
                 {
                     "chain": chain,
-                    "token": evt.args["token"],
-                    "recipient": evt.args["recipient"],
-                    "amount": evt.args["amount"],
-                    "transactionHash": evt.transactionHash.hex(),
-                    "address": evt.address,
+                    "token": Web3.to_checksum_address(evt.token),
+                    "recipient": Web3.to_checksum_address(evt.recipient),
+                    "amount": evt.amount,
+                    # no 0x, as HexBytes.hex() wrote it before the raw decoders
+                    "transactionHash": evt.transactionHash[2:],
+                    "address": Web3.to_checksum_address(evt.address),
                     "date": datetime.utcfromtimestamp(blk_time).strftime(
                         "%Y-%m-%d %H:%M:%S"),
                 }
             )
 
-    else:
-        for block_num in range(start_block,end_block+1):
-            event_filter = contract.events.Deposit.create_filter(from_block=block_num,to_block=block_num,argument_filters=arg_filter)
-            events = event_filter.get_all_entries()
-            #print( f"Got {len(events)} entries for block {block_num}" )
-            # TODO YOUR CODE HERE
-            for evt in events:
-                blk_time = w3.eth.get_block(evt.blockNumber).timestamp
-                rows.append(
-                    {
-                        "chain": chain,
-                        "token": evt.args["token"],
-                        "recipient": evt.args["recipient"],
-                        "amount": evt.args["amount"],
-                        "transactionHash": evt.transactionHash.hex(),
-                        "address": evt.address,
-                        "date": datetime.utcfromtimestamp(blk_time).strftime(
-                            "%Y-%m-%d %H:%M:%S"),
-                    }
-                )
-
     # Write / append to CSV if any rows were gathered
     if rows:
+        import pandas as pd  # only needed when there is something to write
+
         df = pd.DataFrame(rows)
         df = df[
             ["chain", "token", "recipient", "amount", "transactionHash",
              "address", "date"]]
         header_needed = not Path(eventfile).exists()
         df.to_csv(eventfile, mode="a", index=False, header=header_needed)
+
+
+# listener chain name -> section of contract_info.json deployed on that chain
+CHAIN_CONTRACTS = {'avax': 'source', 'bsc': 'destination'}
+
+# events watched on each chain when no handlers are given for them
+DEFAULT_EVENTS = {
+    'avax': ('Deposit', 'Withdrawal', 'Registration'),
+    'bsc': ('Wrap', 'Unwrap', 'Creation'),
+}
+
+# events whose first indexed argument is the bridged token, the only ones the erc20s list filters
+TOKEN_EVENTS = ('Deposit', 'Withdrawal', 'Wrap', 'Unwrap')
+
+
+def connect_to(chain):
+    """
+    chain - string (Either 'bsc' or 'avax')
+    Returns a web3 instance connected to the testnet for that chain
+    """
+    if chain == 'avax':
+        api_url = f"https://api.avax-test.network/ext/bc/C/rpc" #AVAX C-chain testnet
+
+    if chain == 'bsc':
+        api_url = f"https://data-seed-prebsc-1-s1.binance.org:8545/" #BSC testnet
+
+    return rpc_stack.install(Web3(Web3.HTTPProvider(api_url)), chain)
+
+
+def build_event_index(w3, chain, event_names, contract_info="contract_info.json"):
+    """
+    Builds the selector -> decoder index used to decode logs from a single eth_getLogs call
+
+    Returns (addresses, index) where addresses is the list of contract addresses
+    deployed on 'chain' and index maps the topic0 hex string to (event name, decoder)
+    """
+    spec = abi_registry.load(contract_info)[CHAIN_CONTRACTS[chain]]
+    address = Web3.to_checksum_address(spec.address)
+
+    index = {}
+    for name in event_names:
+        if name in spec.events:
+            _, decode = logdecoder.make_decoder(name, logdecoder.abi_inputs(spec.events[name]))
+            index[spec.topics[name]] = (name, decode)
+
+    missing = set(event_names) - {name for name, _ in index.values()}
+    if missing:
+        print( f"Events {sorted(missing)} are not in the {CHAIN_CONTRACTS[chain]} ABI, ignoring them" )
+    return [address], index
+
+
+def token_filter(chain, index, erc20s="erc20s.csv"):
+    """
+    Returns (topics, keep) for fetching the events in 'index' restricted to the tokens in erc20s
+
+    When only TOKEN_EVENTS are watched the tokens go in the topic1 filter.  Otherwise
+    Registration / Creation must still see tokens that are not listed yet, so the
+    query only filters on topic0 and keep(log) drops token events of other tokens.
+    keep is None when nothing is filtered on the client.  When erc20s lists no token
+    for 'chain' the token events are left out (an empty topic1 list would match
+    every token), and topics is None when nothing else is watched.
+    """
+    topics = [list(index)]
+    if erc20s is None:
+        return topics, None
+    tokens = [logdecoder.address_topic(addr) for c, addr in logdecoder.load_erc20s(erc20s) if c == chain]
+    token_topics = {t for t, (name, _) in index.items() if name in TOKEN_EVENTS}
+    if not tokens and token_topics:
+        print( f"{erc20s} lists no {chain} tokens, ignoring {sorted(index[t][0] for t in token_topics)}" )
+        topics = [[t for t in index if t not in token_topics]]
+        return (topics if topics[0] else None), None
+    if token_topics == set(index):
+        return topics + [tokens], None
+    tokens = set(tokens)
+
+    def keep(log):
+        return log["topics"][0] not in token_topics or log["topics"][1].lower() in tokens
+
+    return topics, keep
+
+
+def scan_events(chain, start_block, end_block, handlers=None, contract_info="contract_info.json", erc20s="erc20s.csv", w3=None):
+    """
+    chain - string (Either 'bsc' or 'avax')
+    start_block, end_block - integer (or "latest") block range to scan
+    handlers - dict mapping an event name to a function handler(evt, w3)
+    erc20s - csv of tracked tokens, only Deposit / Withdrawal / Wrap / Unwrap events of
+             these tokens are returned (pass None to watch every token); Registration
+             and Creation are never filtered, they announce tokens not listed yet
+
+    Watches every requested event of every bridge contract on 'chain' with one
+    eth_getLogs call per logdecoder.MAX_RANGE window, decodes each log by its
+    topic0 and dispatches it to the handler registered for that event as a
+    logdecoder record.
+    Returns the number of events dispatched.
+    """
+    if chain not in CHAIN_CONTRACTS:
+        print( f"Invalid chain: {chain}" )
+        return 0
+
+    if w3 is None:
+        w3 = connect_to(chain)
+    if handlers is None:
+        handlers = {name: print_event for name in DEFAULT_EVENTS[chain]}
+
+    addresses, index = build_event_index(w3, chain, list(handlers), contract_info)
+    topics, keep = token_filter(chain, index, erc20s)
+    if topics is None:
+        return 0
+
+    if start_block == "latest":
+        start_block = w3.eth.get_block_number()
+    if end_block == "latest":
+        end_block = w3.eth.get_block_number()
+
+    if end_block < start_block:
+        print( f"Error end_block < start_block!" )
+        return 0
+
+    dispatched = 0
+    for frm in range(start_block, end_block + 1, logdecoder.MAX_RANGE):
+        to = min(frm + logdecoder.MAX_RANGE - 1, end_block)
+        logs = logdecoder.get_raw_logs(w3, frm, to, addresses, topics)
+        for log in logs:
+            entry = index.get(log["topics"][0])
+            if entry is None or (keep is not None and not keep(log)):
+                continue
+            name, decode = entry
+            handlers[name](decode(log), w3)
+            dispatched += 1
+    return dispatched
+
+
+def print_event(evt, w3):
+    """
+    Default handler, prints a decoded event
+    """
+    args = ", ".join(f"{k}={v}" for k, v in evt.args().items())
+    print( f"[{evt.blockNumber}] {evt.event}({args}) tx {evt.transactionHash}" )
+
+
+# websocket endpoints used for newHeads subscriptions, chains without one fall back to filter polling
+WS_URLS = {
+    'avax': "wss://api.avax-test.network/ext/bc/C/ws",
+    'bsc': None,
+}
+WS_RECONNECTS = 3  # consecutive failed websocket connections before falling back to polling
+
+
+class ConfirmationBuffer:
+    """
+    Holds decoded events until their block is 'confirmations' deep
+
+    Events are keyed by (transactionHash, logIndex) so that a log re-delivered
+    after a reorg replaces the old copy, and a log delivered with removed=True
+    (or whose block is dropped from the canonical chain) is discarded before it
+    is ever emitted.  Events below the released height are ignored, so refetching
+    a range never emits an event twice.
+    """
+
+    def __init__(self, confirmations):
+        self.confirmations = confirmations
+        self.pending = {}
+        self.released_upto = -1  # highest block whose events have been released
+
+    def add(self, evt):
+        key = (evt.transactionHash, evt.logIndex)
+        if evt.blockNumber <= self.released_upto:
+            return  # already released, reorgs deeper than the confirmation depth are not undone
+        if evt.removed:
+            self.pending.pop(key, None)
+        else:
+            self.pending[key] = evt
+
+    def drop_from(self, block_number):
+        """
+        Discards every pending event at or above block_number (used when a reorg is detected)
+        """
+        self.pending = {k: e for k, e in self.pending.items() if e.blockNumber < block_number}
+
+    def release(self, head):
+        """
+        Removes and returns the events that are now 'confirmations' blocks deep, in chain order
+        """
+        self.released_upto = max(self.released_upto, head - self.confirmations)
+        ready = [e for e in self.pending.values() if e.blockNumber <= self.released_upto]
+        for e in ready:
+            del self.pending[(e.transactionHash, e.logIndex)]
+        ready.sort(key=lambda e: (e.blockNumber, e.logIndex))
+        return ready
+
+
+def listen(chain, handlers=None, confirmations=1, poll_interval=2.0, contract_info="contract_info.json",
+           erc20s="erc20s.csv", w3=None, ws_url=None, max_heads=None):
+    """
+    chain - string (Either 'bsc' or 'avax')
+    handlers - dict mapping an event name to a function handler(evt, w3), as in scan_events
+    confirmations - number of blocks an event must be buried under before it is dispatched
+    ws_url - websocket endpoint, defaults to WS_URLS[chain]
+    max_heads - stop after this many new heads / polls (None runs forever)
+
+    Realtime counterpart of scan_events.  When a websocket endpoint is available it
+    subscribes to newHeads and fetches the logs of each new block as it arrives,
+    otherwise it installs one eth_newFilter and polls eth_getFilterChanges.
+    Either way events reach their handler as soon as they are 'confirmations' deep.
+    """
+    if chain not in CHAIN_CONTRACTS:
+        print( f"Invalid chain: {chain}" )
+        return
+
+    if w3 is None:
+        w3 = connect_to(chain)
+    if handlers is None:
+        handlers = {name: print_event for name in DEFAULT_EVENTS[chain]}
+    if ws_url is None:
+        ws_url = WS_URLS.get(chain)
+
+    addresses, index = build_event_index(w3, chain, list(handlers), contract_info)
+    topics, keep = token_filter(chain, index, erc20s)
+    if topics is None:
+        return
+
+    buffer = ConfirmationBuffer(confirmations)
+
+    def dispatch(head):
+        for evt in buffer.release(head):
+            handlers[evt.event](evt, w3)
+
+    def decode(logs):
+        for log in logs:
+            entry = index.get(log["topics"][0]) if log["topics"] else None
+            if entry is not None and (keep is None or keep(log)):
+                buffer.add(entry[1](log))
+
+    from_block = None
+    if ws_url:
+        import asyncio
+        import time
+        ws_errors = _ws_errors()
+        progress = {}  # subscription state carried over reconnects
+        failures = 0
+        while failures <= WS_RECONNECTS:
+            heads = progress.get("heads", 0)
+            try:
+                asyncio.run(_listen_ws(ws_url, addresses, topics, decode, buffer, dispatch, max_heads, progress, chain))
+                return
+            except ImportError as e:
+                print( f"Websocket support unavailable ({e})" )
+                break
+            except ws_errors as e:
+                failures = 0 if progress.get("heads", 0) > heads else failures + 1
+                print( f"Websocket subscription to {ws_url} failed ({e!r})"
+                       + (", reconnecting" if failures <= WS_RECONNECTS else "") )
+                if failures <= WS_RECONNECTS:
+                    time.sleep(failures)
+        print( "Falling back to filter polling" )
+        if progress.get("heads"):
+            # pick up after whatever the websocket already delivered
+            from_block = buffer.released_upto + 1 if buffer.released_upto >= 0 else progress["first_block"]
+            if max_heads is not None:
+                max_heads = max(0, max_heads - progress["heads"])
+
+    # new-block reads go ahead of any backfill sharing the endpoint
+    with rpc_scheduler.priority(rpc_scheduler.HEAD):
+        _listen_filter(w3, addresses, topics, decode, buffer, dispatch, poll_interval, max_heads, from_block)
+
+
+def _ws_errors():
+    """
+    Exceptions meaning the websocket could not be opened or was dropped
+    """
+    import asyncio
+    errors = [OSError, asyncio.TimeoutError]
+    try:
+        from web3.exceptions import ProviderConnectionError
+        errors.append(ProviderConnectionError)
+    except ImportError:
+        pass
+    try:
+        from websockets.exceptions import ConnectionClosed
+        errors.append(ConnectionClosed)
+    except ImportError:
+        pass
+    return tuple(errors)
+
+
+def _filter_missing(e):
+    """
+    True for the error a node returns when it has expired (or, behind a load balancer, never seen) our filter
+    """
+    msg = str(e).lower()
+    return "filter" in msg and ("not found" in msg or "does not exist" in msg or "not exist" in msg)
+
+
+def _install_filter(w3, addresses, topics, decode, from_block=None):
+    """
+    Installs the log filter and returns its id.  With from_block, the logs from
+    from_block up to the head are fetched with eth_getLogs once the filter is in
+    place, so nothing falls between an expired filter and its replacement
+    (logs seen twice are merged by the ConfirmationBuffer).
+    """
+    filter_id = w3.manager.request_blocking("eth_newFilter", [{
+        "fromBlock": "latest",
+        "address": addresses,
+        "topics": topics,
+    }])
+    if from_block is not None:
+        head = w3.eth.block_number
+        for frm in range(from_block, head + 1, logdecoder.MAX_RANGE):
+            decode(logdecoder.get_raw_logs(w3, frm, min(frm + logdecoder.MAX_RANGE - 1, head), addresses, topics))
+    return filter_id
+
+
+def _listen_filter(w3, addresses, topics, decode, buffer, dispatch, poll_interval, max_heads, from_block=None):
+    """
+    Polling loop over one persistent log filter, reorged logs come back with removed=True.
+    A filter the node no longer knows is reinstalled from the last dispatched block.
+    """
+    import time
+
+    filter_id = _install_filter(w3, addresses, topics, decode, from_block)
+    polls = 0
+    try:
+        while max_heads is None or polls < max_heads:
+            try:
+                changes = w3.manager.request_blocking("eth_getFilterChanges", [filter_id])
+            except Exception as e:
+                if not _filter_missing(e):
+                    raise
+                print( f"Log filter {filter_id} expired, reinstalling from block {buffer.released_upto + 1}" )
+                filter_id = _install_filter(w3, addresses, topics, decode, max(0, buffer.released_upto + 1))
+                changes = []
+            decode(changes)
+            dispatch(w3.eth.block_number)
+            polls += 1
+            if max_heads is None or polls < max_heads:
+                time.sleep(poll_interval)
+    finally:
+        try:
+            w3.manager.request_blocking("eth_uninstallFilter", [filter_id])
+        except Exception:
+            pass  # already gone on the node
+
+
+async def _listen_ws(ws_url, addresses, topics, decode, buffer, dispatch, max_heads, progress=None, chain=None):
+    """
+    newHeads subscription loop, fetches the logs of every new block with one eth_getLogs
+    and rewinds when a head does not build on the last one seen.  'progress' keeps the
+    loop state so that a reconnect resumes where the dropped socket stopped.
+    The socket's requests go through the same rpc_stack as the HTTP connection's
+    (the ws endpoint has its own token bucket).
+    """
+    from web3 import AsyncWeb3, WebSocketProvider
+
+    if progress is None:
+        progress = {}
+    progress.setdefault("heads", 0)
+    progress.setdefault("canonical", {})  # block number -> hash of the heads seen so far
+    progress.setdefault("next_block", None)
+    progress.setdefault("first_block", None)
+
+    # after a reconnect, heads may have been reorged while the socket was down
+    resumed = progress["next_block"] is not None
+
+    # listen() does the reconnecting, so let the provider give up after one attempt
+    async with AsyncWeb3(WebSocketProvider(ws_url, max_connection_retries=1)) as aw3:
+        rpc_stack.install(aw3, chain)
+        await aw3.eth.subscribe("newHeads")
+        async for msg in aw3.socket.process_subscriptions():
+            header = msg["result"]
+            number = int(header["number"], 16) if isinstance(header["number"], str) else header["number"]
+            block_hash = logdecoder.hexstr(header["hash"])
+            parent = logdecoder.hexstr(header["parentHash"])
+
+            canonical = progress["canonical"]
+            next_block = progress["next_block"]
+            if next_block is None:
+                next_block = progress["first_block"] = number
+            elif resumed or canonical.get(number - 1, parent) != parent or number < next_block:
+                # reorg, refetch everything that has not been dispatched yet
+                buffer.drop_from(buffer.released_upto + 1)
+                next_block = max(progress["first_block"], min(number, buffer.released_upto + 1))
+            resumed = False
+            canonical = {n: h for n, h in canonical.items() if n < number and number - n < 256}
+            canonical[number] = block_hash
+            progress["canonical"] = canonical
+
+            # after a reconnect this also covers the blocks missed while the socket was down
+            logs = await aw3.manager.coro_request("eth_getLogs", [{
+                "fromBlock": hex(next_block),
+                "toBlock": hex(number),
+                "address": addresses,
+                "topics": topics,
+            }])
+            decode(logs)
+            progress["next_block"] = number + 1
+            dispatch(number)
+
+            progress["heads"] += 1
+            if max_heads is not None and progress["heads"] >= max_heads:
+                break
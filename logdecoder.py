@@ -0,0 +1,244 @@
+"""
+    Fast decoder for the bridge's fixed-shape events
+
+    web3's contract event processing builds several AttributeDicts per log and
+    runs the generic ABI codec on every field.  All the events the bridge cares
+    about only carry static 32-byte words (addresses and uint256s), so each field
+    can be sliced straight out of the raw hex of the log's topics and data.
+    Logs are decoded into small __slots__ records.
+"""
+import json
+
+MAX_RANGE = 2_000   # eth_getLogs block span, provider limit is 2 048; stay safely under
+
+# keccak256 of the canonical signatures, precomputed so that decoding never hashes
+KNOWN_TOPICS = {
+    "Deposit(address,address,uint256)": "0x5548c837ab068cf56a2c2479df0882a4922fd203edb7517321831d95078c5f62",
+    "Withdrawal(address,address,uint256)": "0x2717ead6b9200dd235aad468c9809ea400fe33ac69b5bfaa6d3e90fc922b6398",
+    "Registration(address)": "0x478f5152d8fc568db3f8de9fb402fd9d98a1a7541ecfe434e59cf574fbfc5524",
+    "Creation(address,address)": "0x5d8b63f15287bdab6ff15f7cb53d683a8c7be345942343ae319510f5224a6d01",
+    "Wrap(address,address,address,uint256)": "0xbfa61fc27bb37f6f94529a9d0f81f1cc1a422648a9febe15aa90d13c33ed9ad7",
+    "Unwrap(address,address,address,address,uint256)": "0x76c8363176a251e7fc7e9e1efa1368b20f004efe648ee60703b69e78f74ec623",
+    "Transfer(address,address,uint256)": "0xddf252ad1be2c89b69c2b068fc378daa952ba7f163c4a11628f55a4df523b3ef",
+    "Swap(address,address,uint256,uint256)": "0xfa2dda1cc1b86e41239702756b13effbc1a092b5c57e3ad320fbe4f3b13fe235",
+    "LiquidityProvision(address,uint256,uint256)": "0x7e267bd3484fd0db007afa30e5cbf2fbff142102962cc4e416be68da6964d66d",
+    "Withdrawal(address,address,uint256,uint256)": "0xc2b4a290c20fb28939d29f102514fbffd2b73c059ffba8b78250c94161d5fcc6",
+}
+
+# (name, [(field, type, indexed), ...]) of the events emitted by Source.sol and src/Destination.sol
+BRIDGE_EVENTS = [
+    ("Deposit", [("token", "address", True), ("recipient", "address", True), ("amount", "uint256", False)]),
+    ("Withdrawal", [("token", "address", True), ("recipient", "address", True), ("amount", "uint256", False)]),
+    ("Registration", [("token", "address", True)]),
+    ("Creation", [("underlying_token", "address", True), ("wrapped_token", "address", True)]),
+    ("Wrap", [("underlying_token", "address", True), ("wrapped_token", "address", True),
+              ("to", "address", True), ("amount", "uint256", False)]),
+    ("Unwrap", [("underlying_token", "address", True), ("wrapped_token", "address", True),
+                ("frm", "address", False), ("to", "address", True), ("amount", "uint256", False)]),
+]
+
+# events emitted by AMM.sol (its Withdrawal has a different signature from Source's)
+AMM_EVENTS = [
+    ("Swap", [("_inToken", "address", True), ("_outToken", "address", True),
+              ("inAmt", "uint256", False), ("outAmt", "uint256", False)]),
+    ("LiquidityProvision", [("_from", "address", True), ("AQty", "uint256", False), ("BQty", "uint256", False)]),
+    ("Withdrawal", [("_from", "address", True), ("recipient", "address", True),
+                    ("AQty", "uint256", False), ("BQty", "uint256", False)]),
+]
+
+
+class LogRecord:
+    """
+        Base class of decoded logs, subclasses add one slot per event argument
+    """
+    __slots__ = ("address", "blockNumber", "blockHash", "transactionHash", "logIndex", "removed")
+    event = ""
+    fields = ()
+
+    def args(self):
+        return {f: getattr(self, f) for f in self.fields}
+
+    def __repr__(self):
+        args = ", ".join(f"{f}={getattr(self, f)!r}" for f in self.fields)
+        return f"{self.event}({args}) @ {self.blockNumber}"
+
+
+def hexstr(value):
+    """
+        Returns value as a 0x-prefixed lowercase hex string (raw RPC logs already are)
+    """
+    if isinstance(value, str):
+        return value if value.startswith("0x") else "0x" + value
+    return "0x" + bytes.hex(value)
+
+
+def _int(value):
+    return value if isinstance(value, int) else int(value, 16)
+
+
+def _word_reader(typ):
+    """
+        Returns a function turning one 64 hex character word into a python value
+    """
+    if typ == "address":
+        return lambda w: "0x" + w[24:]
+    if typ.startswith("uint"):
+        return lambda w: int(w, 16)
+    if typ.startswith("int"):
+        def read_int(w):
+            v = int(w, 16)
+            return v - (1 << 256) if v >> 255 else v
+        return read_int
+    if typ == "bool":
+        return lambda w: w[-1] != "0"
+    if typ.startswith("bytes") and typ[5:].isdigit():
+        n = int(typ[5:])
+        return lambda w: bytes.fromhex(w[:2 * n])
+    raise ValueError(f"{typ} is not a static type, use web3 to decode this event")
+
+
+def event_signature(name, inputs):
+    return f"{name}({','.join(typ for _, typ, _ in inputs)})"
+
+
+def event_topic(name, inputs):
+    """
+        Returns topic0 of an event as a 0x-prefixed hex string
+    """
+    sig = event_signature(name, inputs)
+    if sig in KNOWN_TOPICS:
+        return KNOWN_TOPICS[sig]
+    from eth_utils import keccak  # only needed for events outside the precomputed table
+    return "0x" + keccak(text=sig).hex()
+
+
+def make_decoder(name, inputs):
+    """
+        name - event name
+        inputs - list of (field, type, indexed) tuples
+
+        Returns (topic0, decode) where decode(log) turns one raw log into a record
+    """
+    record = type(name, (LogRecord,), {
+        "__slots__": tuple(f for f, _, _ in inputs),
+        "event": name,
+        "fields": tuple(f for f, _, _ in inputs),
+    })
+
+    # (field, reader, in_topics, position) with topic positions skipping topic0
+    plan = []
+    t, d = 1, 0
+    for field, typ, indexed in inputs:
+        reader = _word_reader(typ)
+        if indexed:
+            plan.append((field, reader, True, t))
+            t += 1
+        else:
+            plan.append((field, reader, False, 2 + 64 * d))
+            d += 1
+    plan = tuple(plan)
+
+    def decode(log):
+        rec = record.__new__(record)
+        topics = log["topics"]
+        data = log["data"]
+        if not isinstance(data, str):
+            data = hexstr(data)
+        for field, reader, in_topics, pos in plan:
+            if in_topics:
+                word = topics[pos]
+                word = word[2:] if isinstance(word, str) else bytes.hex(word)
+            else:
+                word = data[pos:pos + 64]
+            setattr(rec, field, reader(word))
+        rec.address = log["address"].lower()
+        rec.blockNumber = _int(log["blockNumber"])
+        rec.blockHash = hexstr(log["blockHash"])
+        rec.transactionHash = hexstr(log["transactionHash"])
+        rec.logIndex = _int(log["logIndex"])
+        rec.removed = log.get("removed", False)
+        return rec
+
+    return event_topic(name, inputs), decode
+
+
+def abi_inputs(event_abi):
+    """
+        Converts an ABI event fragment to the (field, type, indexed) list used by make_decoder
+    """
+    if isinstance(event_abi, str):
+        event_abi = json.loads(event_abi)
+    return [(i["name"], i["type"], i.get("indexed", False)) for i in event_abi["inputs"]]
+
+
+DECODERS = {}
+for _name, _inputs in BRIDGE_EVENTS:
+    _topic, _decode = make_decoder(_name, _inputs)
+    DECODERS[_topic] = _decode
+
+AMM_DECODERS = {}
+for _name, _inputs in AMM_EVENTS:
+    _topic, _decode = make_decoder(_name, _inputs)
+    AMM_DECODERS[_topic] = _decode
+
+
+def decode_log(log, decoders=DECODERS):
+    """
+        Decodes one raw log, returns None when its topic0 is not in 'decoders'
+    """
+    topic0 = hexstr(log["topics"][0]) if log["topics"] else None
+    decode = decoders.get(topic0)
+    return decode(log) if decode is not None else None
+
+
+def decode_logs(logs, decoders=DECODERS):
+    """
+        Decodes a list of raw logs, skipping logs with an unknown topic0
+    """
+    out = []
+    for log in logs:
+        topics = log["topics"]
+        if not topics:
+            continue
+        t0 = topics[0]
+        decode = decoders.get(t0 if isinstance(t0, str) else hexstr(t0))
+        if decode is not None:
+            out.append(decode(log))
+    return out
+
+
+def address_word(addr):
+    """
+        Returns an address left-padded to one 32-byte ABI word (64 hex characters, no 0x)
+    """
+    return addr[2:].lower().rjust(64, "0")
+
+
+def address_topic(addr):
+    """
+        Returns the topic an indexed address argument is logged as
+    """
+    return "0x" + address_word(addr)
+
+
+def load_erc20s(erc20s="erc20s.csv"):
+    """
+        Returns the (chain, lowercase address) rows of the erc20s file
+    """
+    with open(erc20s, "r") as f:
+        rows = [line.strip().split(",") for line in f if line.strip()]
+    return [(chain, addr.lower()) for chain, addr in rows[1:]]
+
+
+def get_raw_logs(w3, from_block, to_block, address, topics):
+    """
+        Calls eth_getLogs through the web3 middleware stack but skips web3's
+        per-log result formatting, returning the logs as raw JSON dicts
+    """
+    params = {
+        "fromBlock": hex(from_block) if isinstance(from_block, int) else from_block,
+        "toBlock": hex(to_block) if isinstance(to_block, int) else to_block,
+        "address": address,
+        "topics": topics,
+    }
+    return w3.manager.request_blocking("eth_getLogs", [params])
@@ -1,26 +1,164 @@
-from web3 import Web3, HTTPProvider
-from web3.middleware import ExtraDataToPOAMiddleware
-
-import secrets, json
-
-w3   = Web3(HTTPProvider("https://api.avax-test.network/ext/bc/C/rpc"))
-w3.middleware_onion.inject(ExtraDataToPOAMiddleware, layer=0)
-
-sk   = 0x49a174cad1f78a9891a9ce332dea5c4eee769fcb83f936cd5ba1d3e7baa022d9
-acct = w3.eth.account.from_key(sk)
-
-NFT  = "0x85ac2e065d4526FBeE6a2253389669a12318A412"
-abi  = json.load(open("NFT.abi"))
-nft  = w3.eth.contract(address=NFT, abi=abi)
-
-nonce = secrets.token_bytes(32)
-tx = nft.functions.claim(acct.address, nonce).build_transaction({
-    "from":     acct.address,
-    "nonce":    w3.eth.get_transaction_count(acct.address),
-    "gas":      250_000,
-    "gasPrice": w3.to_wei("25", "gwei"),
-    "chainId":  43113,                 # Fuji
-})
-signed = acct.sign_transaction(tx)
-w3.eth.send_raw_transaction(signed.raw_transaction)
-print("Tx sent → wait ~5 s then check SnowTrace")
+import secrets
+import time
+from concurrent.futures import ThreadPoolExecutor
+import rpc_stack
+import abi_registry
+import fee_oracle
+
+RPC_URL  = "https://api.avax-test.network/ext/bc/C/rpc"
+CHAIN_ID = 43113                 # Fuji
+NFT      = "0x85ac2e065d4526FBeE6a2253389669a12318A412"
+sk       = 0x49a174cad1f78a9891a9ce332dea5c4eee769fcb83f936cd5ba1d3e7baa022d9
+GAS      = 250_000
+TARGET_BLOCKS = 3
+MAX_THREADS = 32  # accounts sending at once, the rest queue for a thread
+
+
+def connect():
+    # web3 is imported here so that importing this module stays cheap
+    from web3 import Web3, HTTPProvider
+
+    return rpc_stack.install(Web3(HTTPProvider(RPC_URL)), "avax")
+
+
+def claim(w3=None, key=sk):
+    """
+        Sends one claim(address, nonce) transaction to the NFT contract, returns the tx hash
+    """
+    if w3 is None:
+        w3 = connect()
+    acct = w3.eth.account.from_key(key)
+    nft  = abi_registry.contract(w3, "nft", address=NFT, path="NFT.abi")
+
+    nonce = secrets.token_bytes(32)
+    tx = nft.functions.claim(acct.address, nonce).build_transaction({
+        "from":     acct.address,
+        "nonce":    w3.eth.get_transaction_count(acct.address),
+        "gas":      GAS,
+        "chainId":  CHAIN_ID,
+        **fee_oracle.get_oracle("avax", w3).fee_params(TARGET_BLOCKS),
+    })
+    signed = acct.sign_transaction(tx)
+    return w3.eth.send_raw_transaction(signed.raw_transaction)
+
+
+def load_keys(filename="mint_keys.txt"):
+    """
+        Reads one private key per line (blank lines and # comments are skipped)
+    """
+    with open(filename, "r") as f:
+        lines = [line.split("#")[0].strip() for line in f]
+    return [k if k.startswith("0x") else "0x" + k for k in lines if k]
+
+
+def _claim_shard(w3, nft, acct, count, timeout):
+    """
+        Sends 'count' claims from one account on its own nonce stream and waits for them
+
+        All the receipts share one 'timeout' deadline, so a stalled chain holds a
+        shard for 'timeout' seconds whatever its size.
+
+        Returns (succeeded tx hashes, claims to retry, claims still pending).  Only
+        claims that reverted or were never sent are retried.  A claim whose receipt
+        did not arrive in time is counted as pending while its nonce is unused:
+        it can still be mined, and sending it again could mint twice.
+    """
+    tx_nonce = w3.eth.get_transaction_count(acct.address, "pending")
+    sent = []
+    for _ in range(count):
+        tx = nft.functions.claim(acct.address, secrets.token_bytes(32)).build_transaction({
+            "from":     acct.address,
+            "nonce":    tx_nonce,
+            "gas":      GAS,
+            "chainId":  CHAIN_ID,
+            **fee_oracle.get_oracle("avax", w3).fee_params(TARGET_BLOCKS),
+        })
+        try:
+            sent.append((w3.eth.send_raw_transaction(acct.sign_transaction(tx).raw_transaction), tx_nonce))
+        except Exception as e:
+            # later nonces would be stuck behind the gap, leave the rest for the next round
+            print( f"{acct.address}: send failed at nonce {tx_nonce}: {e}" )
+            break
+        tx_nonce += 1
+
+    succeeded, retry, pending = [], count - len(sent), 0
+    timed_out = []
+    deadline = time.monotonic() + timeout
+    for tx_hash, n in sent:
+        try:
+            receipt = w3.eth.wait_for_transaction_receipt(tx_hash, timeout=max(deadline - time.monotonic(), 0.1))
+        except Exception as e:
+            print( f"{acct.address}: no receipt for {tx_hash.hex()} yet: {e}" )
+            timed_out.append((tx_hash, n))
+            continue
+        if receipt.status == 1:
+            succeeded.append(tx_hash)
+        else:
+            retry += 1
+
+    if timed_out:
+        mined_nonces = w3.eth.get_transaction_count(acct.address, "latest")
+        for tx_hash, n in timed_out:
+            if n >= mined_nonces:
+                print( f"{acct.address}: {tx_hash.hex()} still pending at nonce {n}, not resending" )
+                pending += 1
+                continue
+            # the nonce has been used since, so the claim was mined
+            try:
+                receipt = w3.eth.get_transaction_receipt(tx_hash)
+            except Exception:
+                receipt = None
+            if receipt is not None and receipt.status == 1:
+                succeeded.append(tx_hash)
+            elif receipt is not None:
+                retry += 1
+            else:
+                print( f"{acct.address}: nonce {n} was used but {tx_hash.hex()} has no receipt, not resending" )
+                pending += 1
+    return succeeded, retry, pending
+
+
+def claim_batch(keys, count, w3=None, max_rounds=3, timeout=120):
+    """
+        keys - private keys of funded accounts
+        count - number of claims to make
+
+        Shards the claims across the accounts, each account sending its share
+        concurrently on its own nonce stream, then collects the receipts.  Claims
+        that reverted or were never sent are retried (with fresh random claim
+        nonces) for up to max_rounds rounds; claims still pending are not.
+        Returns the successful tx hashes.
+    """
+    if not keys:
+        print( "claim_batch: no keys given" )
+        return []
+    if count <= 0:
+        return []
+    if w3 is None:
+        w3 = connect()
+    accounts = [w3.eth.account.from_key(k) for k in keys]
+    nft = abi_registry.contract(w3, "nft", address=NFT, path="NFT.abi")
+
+    succeeded = []
+    remaining = count
+    pending = 0
+    with ThreadPoolExecutor(max_workers=min(len(accounts), MAX_THREADS)) as pool:
+        for round_no in range(1, max_rounds + 1):
+            if remaining == 0:
+                break
+            shares = [remaining // len(accounts) + (i < remaining % len(accounts)) for i in range(len(accounts))]
+            futures = [pool.submit(_claim_shard, w3, nft, acct, share, timeout)
+                       for acct, share in zip(accounts, shares) if share]
+            remaining = 0
+            for fut in futures:
+                ok, retry, still_pending = fut.result()
+                succeeded.extend(ok)
+                remaining += retry
+                pending += still_pending
+            print( f"round {round_no}: {len(succeeded)}/{count} claimed, {pending} pending, {remaining} to retry" )
+    return succeeded
+
+
+if __name__ == "__main__":
+    claim()
+    print("Tx sent → wait ~5 s then check SnowTrace")
@@ -0,0 +1,245 @@
+"""
+    Local proof-of-work chain built from findBlockNonce.mine_block
+
+    Each block commits to the previous block's hash:
+
+        hash = sha256( prev_hash + transactions + nonce )
+
+    with 'difficulty' trailing zero bits, exactly as mine_block searches for.
+    Blocks are appended to a compact binary file, one record per block:
+
+        prev_hash (32) | hash (32) | difficulty (1) | nonce length (1) | payload length (4) | nonce | payload
+
+    where the payload is the block's transactions joined by newlines.  Because
+    each record stores its own hash, linkage is checked with a single pass over
+    the headers, and the sha256 / target checks, which are the expensive part,
+    are spread over worker processes.
+
+        python powchain.py mine chain.bin --blocks 10 --difficulty 16
+        python powchain.py validate chain.bin
+"""
+import hashlib
+import os
+import struct
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import findBlockNonce
+
+GENESIS = hashlib.sha256(b"genesis").digest()
+MAGIC = b"POWC\x01"
+HEADER = struct.Struct(">32s32sBBI")
+CHUNK_SIZE = 4096  # blocks per validation task
+
+
+class Block:
+    __slots__ = ("height", "prev_hash", "hash", "difficulty", "nonce", "transactions")
+
+    def __init__(self, height, prev_hash, block_hash, difficulty, nonce, transactions):
+        self.height = height
+        self.prev_hash = prev_hash
+        self.hash = block_hash
+        self.difficulty = difficulty
+        self.nonce = nonce
+        self.transactions = transactions
+
+    def __repr__(self):
+        return f"Block({self.height}, {self.hash.hex()[:16]}…, difficulty={self.difficulty})"
+
+
+def block_hash(prev_hash, transactions, nonce):
+    """
+        The hash mine_block makes a nonce for
+    """
+    h = hashlib.sha256()
+    h.update(prev_hash)
+    for line in transactions:
+        h.update(line.encode('utf-8'))
+    h.update(nonce)
+    return h.digest()
+
+
+def meets_target(digest, difficulty):
+    return int.from_bytes(digest, 'big') % (1 << difficulty) == 0
+
+
+def encode(block):
+    payload = "\n".join(block.transactions).encode('utf-8')
+    return HEADER.pack(block.prev_hash, block.hash, block.difficulty, len(block.nonce), len(payload)) \
+        + block.nonce + payload
+
+
+def _read_record(f, height):
+    header = f.read(HEADER.size)
+    if not header:
+        return None
+    if len(header) < HEADER.size:
+        raise ValueError(f"{f.name}: truncated record at height {height}")
+    prev_hash, digest, difficulty, nonce_len, payload_len = HEADER.unpack(header)
+    nonce = f.read(nonce_len)
+    payload = f.read(payload_len).decode('utf-8')
+    return Block(height, prev_hash, digest, difficulty, nonce, payload.split("\n") if payload else [])
+
+
+def _open_chain(path):
+    f = open(path, "rb")
+    if f.read(len(MAGIC)) != MAGIC:
+        f.close()
+        raise ValueError(f"{path} is not a chain file")
+    return f
+
+
+def read_blocks(path, offset=None, height=0, count=None):
+    """
+        Yields the blocks stored in 'path' in order, or 'count' blocks starting at
+        byte 'offset' (whose first block is at 'height')
+    """
+    with _open_chain(path) as f:
+        if offset is not None:
+            f.seek(offset)
+        while count is None or count > 0:
+            block = _read_record(f, height)
+            if block is None:
+                return
+            yield block
+            height += 1
+            if count is not None:
+                count -= 1
+
+
+def scan_headers(path):
+    """
+        Yields (height, byte offset, prev_hash, hash) of every record without reading the payloads
+    """
+    with _open_chain(path) as f:
+        offset = f.tell()
+        height = 0
+        while True:
+            header = f.read(HEADER.size)
+            if not header:
+                return
+            if len(header) < HEADER.size:
+                raise ValueError(f"{path}: truncated record at height {height}")
+            prev_hash, digest, _, nonce_len, payload_len = HEADER.unpack(header)
+            yield height, offset, prev_hash, digest
+            offset += HEADER.size + nonce_len + payload_len
+            f.seek(offset)
+            height += 1
+
+
+class Chain:
+    """
+        Append-only chain file, remembers its tip so mining can continue where it stopped
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.height = 0
+        self.tip = GENESIS
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            for height, _, _, digest in scan_headers(path):
+                self.height, self.tip = height + 1, digest
+        else:
+            with open(path, "wb") as f:
+                f.write(MAGIC)
+
+    def append(self, block):
+        with open(self.path, "ab") as f:
+            f.write(encode(block))
+        self.height += 1
+        self.tip = block.hash
+
+    def mine(self, difficulty, transactions):
+        """
+            Mines one block on top of the tip and appends it
+        """
+        nonce = findBlockNonce.mine_block(difficulty, self.tip, transactions)
+        block = Block(self.height, self.tip, block_hash(self.tip, transactions, nonce),
+                      difficulty, nonce, transactions)
+        self.append(block)
+        return block
+
+
+def _check_range(path, offset, height, count, min_difficulty):
+    """
+        Reads 'count' records from byte 'offset' and returns the heights whose hash
+        is wrong or misses its target
+    """
+    bad = []
+    for block in read_blocks(path, offset, height, count):
+        if block.difficulty < min_difficulty \
+                or block_hash(block.prev_hash, block.transactions, block.nonce) != block.hash \
+                or not meets_target(block.hash, block.difficulty):
+            bad.append(block.height)
+    return bad
+
+
+def validate(path, min_difficulty=0, workers=None):
+    """
+        Checks every block of the chain in 'path': linked to its parent, hash
+        correct and meeting its difficulty (at least min_difficulty).
+        Returns the list of invalid heights, empty for a valid chain.
+
+        Linkage is checked in one pass over the record headers, which also
+        notes where every CHUNK_SIZE blocks start.  Each worker is then given
+        only (offset, height, count) and reads and hashes its own records.
+    """
+    bad = []
+    ranges = []
+    prev = GENESIS
+    for height, offset, prev_hash, digest in scan_headers(path):
+        if prev_hash != prev:
+            bad.append(height)
+        prev = digest
+        if height % CHUNK_SIZE == 0:
+            ranges.append((offset, height))
+    count = CHUNK_SIZE
+
+    if len(ranges) <= 1 or workers == 1:
+        for offset, height in ranges:
+            bad.extend(_check_range(path, offset, height, count, min_difficulty))
+    else:
+        n = len(ranges)
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for failed in pool.map(_check_range, [path] * n, [o for o, _ in ranges], [h for _, h in ranges],
+                                   [count] * n, [min_difficulty] * n):
+                bad.extend(failed)
+    return sorted(set(bad))
+
+
+def mine(path, blocks, difficulty, lines=10, transactions_file="bitcoin_text.txt"):
+    """
+        Mines 'blocks' blocks of random transactions onto the chain in 'path', printing each one
+    """
+    chain = Chain(path)
+    start = time.perf_counter()
+    for _ in range(blocks):
+        print(chain.mine(difficulty, findBlockNonce.get_random_lines(transactions_file, lines)))
+    print( f"{blocks} blocks in {time.perf_counter() - start:.2f}s, height {chain.height}" )
+    return chain
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="mine and validate a local proof-of-work chain")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("mine")
+    p.add_argument("path")
+    p.add_argument("--blocks", type=int, default=10)
+    p.add_argument("--difficulty", type=int, default=16)
+    p.add_argument("--lines", type=int, default=10)
+    p.add_argument("--transactions-file", default="bitcoin_text.txt")
+    p = sub.add_parser("validate")
+    p.add_argument("path")
+    p.add_argument("--min-difficulty", type=int, default=0)
+    p.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    if args.command == "mine":
+        mine(args.path, args.blocks, args.difficulty, args.lines, args.transactions_file)
+    else:
+        start = time.perf_counter()
+        bad = validate(args.path, args.min_difficulty, args.workers)
+        took = time.perf_counter() - start
+        print( f"chain valid ({took:.2f}s)" if not bad else f"invalid blocks at heights {bad} ({took:.2f}s)" )
@@ -1,8 +1,8 @@
 import random
 import json
 from web3 import Web3
-from web3.middleware import ExtraDataToPOAMiddleware
 from web3.providers.rpc import HTTPProvider
+import rpc_stack
 
 
 # If you use one of the suggested infrastructure providers, the url will be of the form
@@ -13,7 +13,7 @@ from web3.providers.rpc import HTTPProvider
 def connect_to_eth():
 	# TODO insert your code for this method from last week's assignment
 	url = "https://eth-mainnet.g.alchemy.com/v2/9Ue9e6LZjqj97g0Fa3cKM5msj4nGPp-6"  # FILL THIS IN
-	w3 = Web3(HTTPProvider(url))
+	w3 = rpc_stack.install(Web3(HTTPProvider(url)), 'eth')
 	assert w3.is_connected(), f"Failed to connect to provider at {url}"
 	return w3
 
@@ -30,7 +30,7 @@ def connect_with_middleware(contract_json):
 	w3 = Web3(HTTPProvider(url))
 	assert w3.is_connected(), f"Failed to connect to provider at {url}"
 
-	w3.middleware_onion.inject(ExtraDataToPOAMiddleware, layer=0)
+	rpc_stack.install(w3, 'bsc')
 	contract = w3.eth.contract(address=address, abi=abi)
 
 	return w3, contract
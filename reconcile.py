@@ -0,0 +1,182 @@
+"""
+    Reconciles tokens locked on Source (Fuji) against wrapped supply on Destination (BSC)
+
+    For every underlying token in erc20s.csv the bridge should keep
+
+        balanceOf(Source) on avax  ==  totalSupply(wrapped) on bsc  +  in flight
+
+    where "in flight" is what the relay history says has been deposited but not
+    yet wrapped, less what has been unwrapped but not yet withdrawn.  Each run
+    pins both chains to a final block (head - rpc_cache.FINALITY), reads all
+    balances and supplies at those heights with one JSON-RPC batch per chain,
+    and scans only the Deposit/Withdrawal and Wrap/Unwrap logs since the last
+    reconciled heights.  Totals and heights are kept in STATE_FILE.
+
+    The first run has no history, so it records the imbalance it finds as the
+    opening balance; later runs report any change that the relayed events do not
+    explain.
+
+        python reconcile.py [--contract-info contract_info.json] [--erc20s erc20s.csv]
+"""
+import json
+import os
+
+import logdecoder
+
+STATE_FILE = ".reconcile.json"
+BATCH_SIZE = 100           # eth_calls per JSON-RPC batch
+
+BALANCE_OF = "0x70a08231"   # balanceOf(address)
+TOTAL_SUPPLY = "0x18160ddd" # totalSupply()
+
+DEPOSIT_TOPIC = logdecoder.KNOWN_TOPICS["Deposit(address,address,uint256)"]
+WITHDRAWAL_TOPIC = logdecoder.KNOWN_TOPICS["Withdrawal(address,address,uint256)"]
+WRAP_TOPIC = logdecoder.KNOWN_TOPICS["Wrap(address,address,address,uint256)"]
+UNWRAP_TOPIC = logdecoder.KNOWN_TOPICS["Unwrap(address,address,address,address,uint256)"]
+
+TOTALS = ("deposited", "withdrawn", "wrapped", "unwrapped")
+
+
+def load_state(path=STATE_FILE):
+    if path and os.path.exists(path):
+        with open(path, "r") as f:
+            return json.load(f)
+    return {"blocks": {}, "tokens": {}}
+
+
+def save_state(state, path=STATE_FILE):
+    if not path:
+        return
+    with open(path, "w") as f:
+        json.dump(state, f, indent=1)
+
+
+def pinned_block(w3, chain):
+    """
+        Newest block of 'chain' deep enough to be final
+    """
+    import rpc_cache
+    return max(0, w3.eth.block_number - rpc_cache.FINALITY.get(chain, rpc_cache.DEFAULT_FINALITY))
+
+
+def batch_calls(w3, calls, block):
+    """
+        Runs [(to, data), ...] as eth_calls at 'block' in JSON-RPC batches,
+        returns the results as ints (None for a call that returned nothing)
+    """
+    out = []
+    for i in range(0, len(calls), BATCH_SIZE):
+        with w3.batch_requests() as batch:
+            for to, data in calls[i:i + BATCH_SIZE]:
+                batch.add(w3.eth.call({"to": to, "data": data}, block))
+            out.extend(int.from_bytes(r, "big") if r else None for r in batch.execute())
+    return out
+
+
+def scan_history(w3, address, topics, from_block, to_block):
+    """
+        Decoded bridge logs of 'address' in [from_block, to_block], in logdecoder.MAX_RANGE windows
+        (no request at all when the range is empty)
+    """
+    events = []
+    for frm in range(from_block, to_block + 1, logdecoder.MAX_RANGE):
+        events.extend(logdecoder.decode_logs(logdecoder.get_raw_logs(
+            w3, frm, min(frm + logdecoder.MAX_RANGE - 1, to_block), address, [topics])))
+    return events
+
+
+def reconcile(contract_info="contract_info.json", erc20s="erc20s.csv", path=STATE_FILE, w3_src=None, w3_dst=None):
+    """
+        Runs one incremental reconciliation and returns a list of per-token reports:
+        {token, wrapped, locked, supply, in_flight, discrepancy}
+    """
+    from web3 import Web3
+    import abi_registry
+    import bridge
+    import token_registry
+
+    w3_src = w3_src or bridge.connect_to("source")
+    w3_dst = w3_dst or bridge.connect_to("destination")
+    C_src = abi_registry.contract(w3_src, "source", path=contract_info)
+    C_dst = abi_registry.contract(w3_dst, "destination", path=contract_info)
+    tokens = token_registry.get_registry(erc20s)
+
+    underlying = sorted({addr for chain, addr in logdecoder.load_erc20s(erc20s) if chain == "avax"})
+
+    state = load_state(path)
+    src_block = pinned_block(w3_src, "avax")
+    dst_block = pinned_block(w3_dst, "bsc")
+    # the first run only takes the opening balances, history starts after them
+    src_from = state["blocks"].get("avax", src_block)
+    dst_from = state["blocks"].get("bsc", dst_block)
+    # a lagging node can report an older head than the last run saw: never go back,
+    # the history up to src_from / dst_from is already counted (and nothing is scanned)
+    src_block = max(src_block, src_from)
+    dst_block = max(dst_block, dst_from)
+
+    # relay history since the last reconciled heights
+    totals = state["tokens"]
+    for u in underlying:
+        totals.setdefault(u, {k: 0 for k in TOTALS})
+    for ev in scan_history(w3_src, C_src.address, [DEPOSIT_TOPIC, WITHDRAWAL_TOPIC], src_from + 1, src_block):
+        entry = totals.get(ev.token)
+        if entry is not None:
+            entry["deposited" if ev.event == "Deposit" else "withdrawn"] += ev.amount
+    for ev in scan_history(w3_dst, C_dst.address, [WRAP_TOPIC, UNWRAP_TOPIC], dst_from + 1, dst_block):
+        tokens.add_wrapped(ev.underlying_token, ev.wrapped_token)
+        entry = totals.get(ev.underlying_token)
+        if entry is not None:
+            entry["wrapped" if ev.event == "Wrap" else "unwrapped"] += ev.amount
+
+    pairs = []
+    for u in underlying:
+        w = tokens.wrapped_token(u, C_dst)
+        if w is None:
+            print( f"{u}: no wrapped token on destination, skipped" )
+        else:
+            pairs.append((u, w))
+
+    # balances and supplies at the pinned heights, one batch per chain
+    locked = batch_calls(w3_src, [(Web3.to_checksum_address(u), BALANCE_OF + logdecoder.address_word(C_src.address))
+                                  for u, _ in pairs], src_block)
+    supply = batch_calls(w3_dst, [(Web3.to_checksum_address(w), TOTAL_SUPPLY) for _, w in pairs], dst_block)
+
+    reports = []
+    for (u, w), bal, sup in zip(pairs, locked, supply):
+        entry = totals[u]
+        bal, sup = bal or 0, sup or 0
+        in_flight = (entry["deposited"] - entry["withdrawn"]) - (entry["wrapped"] - entry["unwrapped"])
+        if "opening" not in entry:
+            # imbalance carried in from before the history we have
+            entry["opening"] = bal - sup - in_flight
+        reports.append({
+            "token": u,
+            "wrapped": w,
+            "locked": bal,
+            "supply": sup,
+            "in_flight": in_flight,
+            "discrepancy": bal - sup - entry["opening"] - in_flight,
+        })
+
+    state["blocks"] = {"avax": src_block, "bsc": dst_block}
+    save_state(state, path)
+    tokens.save()
+    return reports
+
+
+def print_report(reports):
+    for r in reports:
+        status = "ok" if r["discrepancy"] == 0 else f"MISMATCH {r['discrepancy']:+d}"
+        print( f"{r['token']} locked={r['locked']} wrapped_supply={r['supply']} "
+               f"in_flight={r['in_flight']} {status}" )
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="reconcile locked tokens against wrapped supply")
+    parser.add_argument("--contract-info", default="contract_info.json")
+    parser.add_argument("--erc20s", default="erc20s.csv")
+    parser.add_argument("--state", default=STATE_FILE)
+    args = parser.parse_args()
+    print_report(reconcile(args.contract_info, args.erc20s, args.state))
@@ -0,0 +1,271 @@
+"""
+    Read-through cache for immutable RPC results
+
+    Some responses can never change once a block is final: the chain id, blocks
+    and receipts below the finality depth, eth_call / eth_getLogs pinned to a
+    final block, anything addressed by block hash.  This middleware recognises
+    those requests, keeps their responses in a bounded LRU and answers repeats
+    without touching the network.
+
+        w3 = Web3(Web3.HTTPProvider(url))
+        rpc_cache.install(w3, "bsc", finality=rpc_cache.FINALITY["bsc"])
+
+    Caches are shared per name, so every Web3 built for the same chain in one
+    process (the listener's, reconcile's, the bridge's) uses the same entries.  When
+    RPC_CACHE_DIR is set each cache is loaded from and saved to a pickle there.
+"""
+import atexit
+import json
+import os
+import pickle
+import threading
+from collections import OrderedDict
+
+# blocks a chain needs on top of a block before we treat it as final
+FINALITY = {
+    'avax': 1,      # Snowman has single-block finality
+    'bsc': 15,
+    'eth': 64,      # two epochs
+}
+DEFAULT_FINALITY = 64
+
+# methods whose result never changes on a given endpoint
+CONSTANT_METHODS = {"eth_chainId", "net_version"}
+
+# methods whose last parameter is a block identifier
+STATE_METHODS = {"eth_call", "eth_getBalance", "eth_getCode", "eth_getStorageAt", "eth_getTransactionCount"}
+
+# methods whose result is either null or tied to the block it was mined in
+TX_METHODS = {"eth_getTransactionReceipt", "eth_getTransactionByHash"}
+
+BLOCK_TAGS = {"latest", "pending", "safe", "finalized"}
+
+
+def _number(value):
+    if isinstance(value, int):
+        return value
+    if value == "earliest":
+        return 0
+    if isinstance(value, str) and value.startswith("0x"):
+        return int(value, 16)
+    return None
+
+
+class ResponseCache:
+    """
+        Bounded LRU of RPC responses plus the chain head used to judge finality
+    """
+
+    def __init__(self, maxsize=10_000, finality=DEFAULT_FINALITY, path=None):
+        self.maxsize = maxsize
+        self.finality = finality
+        self.path = path
+        self.head = None
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            self.load()
+
+    def get(self, key):
+        with self._lock:
+            response = self._entries.get(key)
+            if response is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return response
+
+    def put(self, key, response):
+        with self._lock:
+            self._entries[key] = response
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def see_head(self, number):
+        if number is not None and (self.head is None or number > self.head):
+            self.head = number
+
+    def is_final(self, number):
+        return number is not None and self.head is not None and number <= self.head - self.finality
+
+    def load(self):
+        try:
+            with open(self.path, "rb") as f:
+                entries = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError) as e:
+            print( f"Ignoring unreadable RPC cache {self.path}: {e}" )
+            return
+        with self._lock:
+            self._entries.update(entries)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def save(self):
+        if not self.path:
+            return
+        with self._lock:
+            entries = OrderedDict(self._entries)
+        tmp = self.path + ".tmp"
+        with open(tmp, "wb") as f:
+            pickle.dump(entries, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, self.path)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def _block_param_final(cache, block):
+    """
+        True when a block identifier (number, tag or EIP-1898 object) names a final block
+    """
+    if isinstance(block, dict):
+        if "blockHash" in block:
+            return True
+        block = block.get("blockNumber")
+    if block in BLOCK_TAGS:
+        return False
+    return cache.is_final(_number(block))
+
+
+def cacheable(cache, method, params, result):
+    """
+        Decides whether a successful response to (method, params) may be cached
+    """
+    if method in CONSTANT_METHODS:
+        return True
+    if result is None:
+        return False  # unknown tx / block, may appear later
+    if method == "eth_getBlockByHash":
+        return True
+    if method == "eth_getBlockByNumber":
+        return params[0] not in BLOCK_TAGS and cache.is_final(_number(params[0]))
+    if method in TX_METHODS:
+        return cache.is_final(_number(result.get("blockNumber")))
+    if method in STATE_METHODS:
+        return len(params) > 1 and _block_param_final(cache, params[-1])
+    if method == "eth_getLogs":
+        flt = params[0]
+        if "blockHash" in flt:
+            return True
+        return flt.get("toBlock") not in (None, *BLOCK_TAGS) and cache.is_final(_number(flt["toBlock"]))
+    return False
+
+
+def cache_middleware(cache):
+    """
+        Returns a web3 middleware class serving immutable requests from 'cache'
+    """
+    from web3.middleware import Web3Middleware
+
+    def lookup(method, params):
+        """
+            Returns (key, cached response or None), key is None for uncacheable methods
+        """
+        if method == "eth_blockNumber":
+            return None, None
+        key = (method, json.dumps(params, sort_keys=True, default=str))
+        response = cache.get(key)
+        return key, dict(response) if response is not None else None
+
+    def store(key, method, params, response):
+        if "error" in response:
+            return
+        result = response.get("result")
+        # keep track of the head so that depth can be judged without extra calls
+        if method == "eth_blockNumber":
+            cache.see_head(_number(result))
+        elif method == "eth_getBlockByNumber" and params and params[0] == "latest" and result:
+            cache.see_head(_number(result.get("number")))
+        elif key is not None and cacheable(cache, method, params, result):
+            cache.put(key, response)
+
+    class ResponseCacheMiddleware(Web3Middleware):
+
+        def wrap_make_request(self, make_request):
+
+            def middleware(method, params):
+                key, response = lookup(method, params)
+                if response is not None:
+                    return response
+                response = make_request(method, params)
+                store(key, method, params, response)
+                return response
+
+            return middleware
+
+        async def async_wrap_make_request(self, make_request):
+
+            async def middleware(method, params):
+                key, response = lookup(method, params)
+                if response is not None:
+                    return response
+                response = await make_request(method, params)
+                store(key, method, params, response)
+                return response
+
+            return middleware
+
+        def wrap_make_batch_request(self, make_batch_request):
+
+            def middleware(requests_info):
+                requests_info = list(requests_info)
+                keys, responses, missing = [], [], []
+                for i, (method, params) in enumerate(requests_info):
+                    key, response = lookup(method, params)
+                    keys.append(key)
+                    responses.append(response)
+                    if response is None:
+                        missing.append(i)
+                if not missing:
+                    return responses
+
+                # only the calls the cache cannot answer go to the node
+                fetched = make_batch_request([requests_info[i] for i in missing])
+                if not isinstance(fetched, list):
+                    return fetched  # the batch was refused with a single error object
+                for i, response in zip(missing, fetched):
+                    method, params = requests_info[i]
+                    store(keys[i], method, params, response)
+                    responses[i] = response
+                return responses
+
+            return middleware
+
+    return ResponseCacheMiddleware
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_cache(name, finality=None, maxsize=10_000):
+    """
+        Returns the process-wide cache for 'name', creating it on first use
+    """
+    with _caches_lock:
+        cache = _caches.get(name)
+        if cache is None:
+            path = None
+            if os.environ.get("RPC_CACHE_DIR"):
+                os.makedirs(os.environ["RPC_CACHE_DIR"], exist_ok=True)
+                path = os.path.join(os.environ["RPC_CACHE_DIR"], f"{name}.pickle")
+            if finality is None:
+                finality = FINALITY.get(name, DEFAULT_FINALITY)
+            cache = _caches[name] = ResponseCache(maxsize=maxsize, finality=finality, path=path)
+            if path:
+                atexit.register(cache.save)
+        return cache
+
+
+def install(w3, name, finality=None, maxsize=10_000):
+    """
+        Adds the cache for 'name' as the outermost middleware of w3 (so hits skip
+        every other layer, including rpc_metrics) and returns the cache
+    """
+    cache = get_cache(name, finality, maxsize)
+    w3.middleware_onion.add(cache_middleware(cache), name="rpc_cache")
+    return cache
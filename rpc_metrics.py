@@ -0,0 +1,281 @@
+"""
+    RPC instrumentation middleware
+
+    Records, per endpoint and JSON-RPC method, the number of calls, errors,
+    request / response payload sizes and a latency histogram.  Metrics can be
+    read as a JSON snapshot, rendered in the Prometheus text format (optionally
+    served over HTTP) or printed as a summary at the end of a run.
+
+        w3 = Web3(Web3.HTTPProvider(url))
+        rpc_metrics.instrument(w3)
+        ...
+        print(rpc_metrics.METRICS.summary())
+
+    Setting RPC_METRICS=1 in the environment prints the summary when the process
+    exits, RPC_METRICS=path.json writes the snapshot to that file instead.
+"""
+import atexit
+import json
+import os
+import threading
+import time
+
+# upper bounds (seconds) of the latency histogram buckets, +Inf is implied
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class MethodStats:
+    __slots__ = ("calls", "errors", "request_bytes", "response_bytes", "latency_sum", "latency_max", "buckets")
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.request_bytes = 0
+        self.response_bytes = 0
+        self.latency_sum = 0.0
+        self.latency_max = 0.0
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+
+    def as_dict(self):
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "error_rate": self.errors / self.calls if self.calls else 0.0,
+            "request_bytes": self.request_bytes,
+            "response_bytes": self.response_bytes,
+            "latency_avg_ms": 1000 * self.latency_sum / self.calls if self.calls else 0.0,
+            "latency_max_ms": 1000 * self.latency_max,
+            "latency_buckets": dict(zip([str(b) for b in LATENCY_BUCKETS] + ["+Inf"], self.buckets)),
+        }
+
+
+class RpcMetrics:
+    """
+        Thread-safe store of MethodStats keyed by (endpoint, method)
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stats = {}
+        self.started = time.time()
+
+    def observe(self, endpoint, method, latency, request_bytes, response_bytes, error):
+        with self._lock:
+            s = self.stats.get((endpoint, method))
+            if s is None:
+                s = self.stats[(endpoint, method)] = MethodStats()
+            s.calls += 1
+            s.errors += bool(error)
+            s.request_bytes += request_bytes
+            s.response_bytes += response_bytes
+            s.latency_sum += latency
+            s.latency_max = max(s.latency_max, latency)
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if latency <= bound:
+                    s.buckets[i] += 1
+                    break
+            else:
+                s.buckets[-1] += 1
+
+    def reset(self):
+        with self._lock:
+            self.stats = {}
+            self.started = time.time()
+
+    def calls(self, method=None):
+        """
+            Total number of calls, optionally restricted to one method
+        """
+        with self._lock:
+            return sum(s.calls for (_, m), s in self.stats.items() if method is None or m == method)
+
+    def snapshot(self):
+        """
+            Returns {endpoint: {method: stats dict}}
+        """
+        with self._lock:
+            out = {}
+            for (endpoint, method), s in sorted(self.stats.items()):
+                out.setdefault(endpoint, {})[method] = s.as_dict()
+            return out
+
+    def to_prometheus(self):
+        """
+            Renders the metrics in the Prometheus text exposition format
+        """
+        lines = [
+            "# TYPE rpc_calls_total counter",
+            "# TYPE rpc_errors_total counter",
+            "# TYPE rpc_request_bytes_total counter",
+            "# TYPE rpc_response_bytes_total counter",
+            "# TYPE rpc_latency_seconds histogram",
+        ]
+        with self._lock:
+            for (endpoint, method), s in sorted(self.stats.items()):
+                labels = f'endpoint="{endpoint}",method="{method}"'
+                lines.append(f"rpc_calls_total{{{labels}}} {s.calls}")
+                lines.append(f"rpc_errors_total{{{labels}}} {s.errors}")
+                lines.append(f"rpc_request_bytes_total{{{labels}}} {s.request_bytes}")
+                lines.append(f"rpc_response_bytes_total{{{labels}}} {s.response_bytes}")
+                cumulative = 0
+                for bound, count in zip(list(LATENCY_BUCKETS) + ["+Inf"], s.buckets):
+                    cumulative += count
+                    lines.append(f'rpc_latency_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f"rpc_latency_seconds_sum{{{labels}}} {s.latency_sum}")
+                lines.append(f"rpc_latency_seconds_count{{{labels}}} {s.calls}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self):
+        """
+            Human readable per-method table, busiest methods first
+        """
+        rows = []
+        with self._lock:
+            items = sorted(self.stats.items(), key=lambda kv: -kv[1].calls)
+            for (endpoint, method), s in items:
+                avg = 1000 * s.latency_sum / s.calls if s.calls else 0.0
+                rows.append(f"{method:<32} {s.calls:>7} {s.errors:>6} {avg:>9.1f} {1000 * s.latency_max:>9.1f} "
+                            f"{s.request_bytes:>10} {s.response_bytes:>11}  {endpoint}")
+        header = f"{'method':<32} {'calls':>7} {'errors':>6} {'avg ms':>9} {'max ms':>9} {'req bytes':>10} {'resp bytes':>11}  endpoint"
+        total = f"{len(rows)} methods, {self.calls()} calls in {time.time() - self.started:.1f}s"
+        return "\n".join([header] + rows + [total])
+
+
+# process-wide default store used by instrument()
+METRICS = RpcMetrics()
+
+
+def _size(obj):
+    try:
+        return len(json.dumps(obj, default=str))
+    except (TypeError, ValueError):
+        return 0
+
+
+def metrics_middleware(metrics=METRICS):
+    """
+        Returns a web3 middleware class that records every request into 'metrics'
+    """
+    from web3.middleware import Web3Middleware  # deferred so importing this module stays cheap
+
+    class RpcMetricsMiddleware(Web3Middleware):
+
+        def _endpoint(self):
+            provider = self._w3.provider
+            return str(getattr(provider, "endpoint_uri", None) or type(provider).__name__)
+
+        def wrap_make_request(self, make_request):
+            endpoint = self._endpoint()
+
+            def middleware(method, params):
+                start = time.perf_counter()
+                response, error = None, True
+                try:
+                    response = make_request(method, params)
+                    error = "error" in response
+                    return response
+                finally:
+                    metrics.observe(endpoint, method, time.perf_counter() - start,
+                                    _size(params), _size(response) if response is not None else 0, error)
+
+            return middleware
+
+        def wrap_make_batch_request(self, make_batch_request):
+            endpoint = self._endpoint()
+
+            def middleware(requests_info):
+                requests_info = list(requests_info)
+                start = time.perf_counter()
+                response = None
+                try:
+                    response = make_batch_request(requests_info)
+                    return response
+                finally:
+                    # every call in the batch is counted, each with the batch's round trip as latency
+                    latency = time.perf_counter() - start
+                    if isinstance(response, list):
+                        for (method, params), r in zip(requests_info, response):
+                            metrics.observe(endpoint, method, latency, _size(params), _size(r), "error" in r)
+                    else:
+                        for method, params in requests_info:
+                            metrics.observe(endpoint, method, latency, _size(params), 0, True)
+
+            return middleware
+
+        async def async_wrap_make_request(self, make_request):
+            endpoint = self._endpoint()
+
+            async def middleware(method, params):
+                start = time.perf_counter()
+                response, error = None, True
+                try:
+                    response = await make_request(method, params)
+                    error = "error" in response
+                    return response
+                finally:
+                    metrics.observe(endpoint, method, time.perf_counter() - start,
+                                    _size(params), _size(response) if response is not None else 0, error)
+
+            return middleware
+
+    return RpcMetricsMiddleware
+
+
+_exit_report_registered = False
+
+
+def instrument(w3, metrics=METRICS):
+    """
+        Adds the metrics middleware to w3 as the current outermost layer and returns w3
+
+        It times the request through the layers added before it and the provider.
+        rpc_scheduler and rpc_cache are installed after it, so calls answered from
+        the cache are not counted and the time spent queueing for a rate-limit
+        token is not part of the recorded latency.
+    """
+    global _exit_report_registered
+    w3.middleware_onion.add(metrics_middleware(metrics), name="rpc_metrics")
+    if os.environ.get("RPC_METRICS") and not _exit_report_registered and metrics is METRICS:
+        atexit.register(report, os.environ["RPC_METRICS"])
+        _exit_report_registered = True
+    return w3
+
+
+def report(target="1", metrics=METRICS):
+    """
+        Per-run summary, printed, or written as a JSON snapshot when target is a .json path
+    """
+    if target.endswith(".json"):
+        with open(target, "w") as f:
+            json.dump(metrics.snapshot(), f, indent=2)
+    else:
+        print(metrics.summary())
+
+
+def serve(port=9100, metrics=METRICS):
+    """
+        Serves /metrics (Prometheus text) and /metrics.json from a daemon thread, returns the server
+    """
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path == "/metrics":
+                body, ctype = metrics.to_prometheus().encode(), "text/plain; version=0.0.4"
+            elif self.path == "/metrics.json":
+                body, ctype = json.dumps(metrics.snapshot()).encode(), "application/json"
+            else:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", ctype)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
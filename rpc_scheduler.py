@@ -0,0 +1,289 @@
+"""
+    Priority-aware RPC scheduler with per-endpoint rate limiting
+
+    Every request made through an instrumented Web3 takes a token from its
+    endpoint's token bucket before it is sent.  When requests queue up for
+    tokens they are served by priority class, so a transaction submission never
+    waits behind a backfill crawl that shares the endpoint:
+
+        TX        eth_sendRawTransaction and anything run under priority(TX)
+        HEAD      head polling and the reads on a relay's critical path
+        BACKFILL  everything else (bulk log scans, metadata crawls)
+
+    A request's class is the higher of its method's default and the class set
+    with the priority() context manager.  HTTP 429 responses (and JSON-RPC rate
+    limit errors) halve the endpoint's rate, pause it for the Retry-After time or
+    an exponential backoff, and retry the request; successes creep the rate
+    back up to its configured value.  A JSON-RPC batch takes one token per call
+    it carries.
+
+    Buckets are per process: two processes sharing an endpoint (a cron backfill
+    next to the relayer, say) each get the full rate and do not see each other's
+    priorities, so give a separate backfill process a lower rate with
+    install(w3, rate=...) to leave headroom for the relayer.
+
+        rpc_scheduler.install(w3, rate=10)
+        with rpc_scheduler.priority(rpc_scheduler.HEAD):
+            ...
+"""
+import contextvars
+import heapq
+import itertools
+import threading
+import time
+from contextlib import contextmanager
+
+TX, HEAD, BACKFILL = 0, 1, 2
+
+METHOD_PRIORITY = {
+    "eth_sendRawTransaction": TX,
+    "eth_sendTransaction": TX,
+    "eth_blockNumber": HEAD,
+    "eth_getFilterChanges": HEAD,
+    "eth_getTransactionCount": HEAD,
+    "eth_getTransactionReceipt": HEAD,
+    "eth_feeHistory": HEAD,
+    "eth_gasPrice": HEAD,
+    "eth_estimateGas": HEAD,
+    "eth_chainId": HEAD,
+}
+
+DEFAULT_RATE = 20.0     # requests per second per endpoint
+DEFAULT_BURST = 10
+MAX_RETRIES = 5
+MAX_BACKOFF = 30.0      # seconds
+
+# JSON-RPC error codes providers use for rate limiting
+RATE_LIMIT_CODES = {429, -32005, -32029}
+
+_priority = contextvars.ContextVar("rpc_priority", default=BACKFILL)
+
+
+@contextmanager
+def priority(level):
+    """
+        Runs the enclosed RPC calls at 'level' (TX, HEAD or BACKFILL) or higher
+    """
+    token = _priority.set(level)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+class RateLimited(Exception):
+    def __init__(self, retry_after=None):
+        super().__init__("rate limited")
+        self.retry_after = retry_after
+
+
+class EndpointScheduler:
+    """
+        Token bucket for one endpoint, handing out tokens to waiters in priority order
+    """
+
+    def __init__(self, rate=DEFAULT_RATE, burst=DEFAULT_BURST):
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.paused_until = 0.0
+        self.failures = 0
+        self._stamp = time.monotonic()
+        self._waiting = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self._stamp) * self.rate)
+        self._stamp = now
+
+    def acquire(self, level, n=1):
+        """
+            Blocks until this caller, as the highest-priority waiter, has taken 'n' tokens.
+            A large batch takes its tokens as they refill, and a higher-priority caller
+            arriving meanwhile goes first.
+        """
+        with self._cond:
+            ticket = (level, next(self._seq))
+            heapq.heappush(self._waiting, ticket)
+            while True:
+                if self._waiting[0] != ticket:
+                    self._cond.wait()
+                    continue
+                now = time.monotonic()
+                self._refill(now)
+                if now >= self.paused_until and self.tokens >= 1:
+                    take = min(n, int(self.tokens))
+                    self.tokens -= take
+                    n -= take
+                    if not n:
+                        heapq.heappop(self._waiting)
+                        self._cond.notify_all()
+                        return
+                wait = max(self.paused_until - now, (1 - self.tokens) / self.rate, 0.001)
+                self._cond.wait(timeout=wait)
+
+    def throttled(self, retry_after=None):
+        """
+            Called on a 429: halve the rate and pause the endpoint, returns the pause in seconds
+        """
+        with self._cond:
+            self.failures += 1
+            self.rate = max(self.max_rate / 64, self.rate / 2)
+            self.tokens = 0.0
+            pause = retry_after if retry_after is not None else min(MAX_BACKOFF, 0.25 * 2 ** (self.failures - 1))
+            self.paused_until = max(self.paused_until, time.monotonic() + pause)
+            self._cond.notify_all()
+            return pause
+
+    def succeeded(self):
+        with self._cond:
+            self.failures = 0
+            if self.rate < self.max_rate:
+                self.rate = min(self.max_rate, self.rate + self.max_rate / 20)
+
+
+def _rate_limited(exc=None, response=None):
+    """
+        Returns a RateLimited when an exception or JSON-RPC response signals rate limiting
+    """
+    if exc is not None:
+        resp = getattr(exc, "response", None)
+        if getattr(resp, "status_code", None) == 429:
+            retry_after = resp.headers.get("Retry-After") if getattr(resp, "headers", None) else None
+            try:
+                retry_after = float(retry_after) if retry_after is not None else None
+            except ValueError:
+                retry_after = None
+            return RateLimited(retry_after)
+        return None
+    error = response.get("error") if isinstance(response, dict) else None
+    if isinstance(error, dict) and (error.get("code") in RATE_LIMIT_CODES or "rate limit" in str(error.get("message", "")).lower()):
+        return RateLimited()
+    return None
+
+
+_schedulers = {}
+_schedulers_lock = threading.Lock()
+
+
+def get_scheduler(endpoint, rate=None, burst=None):
+    """
+        Returns the process-wide scheduler for 'endpoint', so every Web3 using it shares one quota
+    """
+    with _schedulers_lock:
+        sched = _schedulers.get(endpoint)
+        if sched is None:
+            sched = _schedulers[endpoint] = EndpointScheduler(rate or DEFAULT_RATE, burst or DEFAULT_BURST)
+        return sched
+
+
+def scheduler_middleware(sched):
+    """
+        Returns a web3 middleware class that routes every request through 'sched'
+    """
+    from web3.middleware import Web3Middleware
+
+    class RpcSchedulerMiddleware(Web3Middleware):
+
+        def wrap_make_request(self, make_request):
+
+            def middleware(method, params):
+                level = min(_priority.get(), METHOD_PRIORITY.get(method, BACKFILL))
+                for attempt in range(MAX_RETRIES + 1):
+                    sched.acquire(level)
+                    try:
+                        response = make_request(method, params)
+                    except Exception as e:
+                        limited = _rate_limited(exc=e)
+                        if limited is None or attempt == MAX_RETRIES:
+                            raise
+                    else:
+                        limited = _rate_limited(response=response)
+                        if limited is None or attempt == MAX_RETRIES:
+                            sched.succeeded()
+                            return response
+                    sched.throttled(limited.retry_after)
+
+            return middleware
+
+        async def async_wrap_make_request(self, make_request):
+            import asyncio
+
+            async def middleware(method, params):
+                level = min(_priority.get(), METHOD_PRIORITY.get(method, BACKFILL))
+                for attempt in range(MAX_RETRIES + 1):
+                    # acquire() blocks, so queue for the token off the event loop
+                    await asyncio.to_thread(sched.acquire, level)
+                    try:
+                        response = await make_request(method, params)
+                    except Exception as e:
+                        limited = _rate_limited(exc=e)
+                        if limited is None or attempt == MAX_RETRIES:
+                            raise
+                    else:
+                        limited = _rate_limited(response=response)
+                        if limited is None or attempt == MAX_RETRIES:
+                            sched.succeeded()
+                            return response
+                    sched.throttled(limited.retry_after)
+
+            return middleware
+
+        def wrap_make_batch_request(self, make_batch_request):
+
+            def middleware(requests_info):
+                requests_info = list(requests_info)
+                level = min([_priority.get()] + [METHOD_PRIORITY.get(m, BACKFILL) for m, _ in requests_info])
+                responses = [None] * len(requests_info)
+                pending = list(range(len(requests_info)))
+                for attempt in range(MAX_RETRIES + 1):
+                    # one token per call in the batch
+                    sched.acquire(level, len(pending))
+                    try:
+                        response = make_batch_request([requests_info[i] for i in pending])
+                    except Exception as e:
+                        limited = _rate_limited(exc=e)
+                        if limited is None or attempt == MAX_RETRIES:
+                            raise
+                    else:
+                        if not isinstance(response, list):
+                            # the whole batch was refused with a single error object
+                            limited = _rate_limited(response=response)
+                            if limited is None or attempt == MAX_RETRIES:
+                                return response
+                        else:
+                            # keep the answered calls, resend only the rate limited ones
+                            retry, limited = [], None
+                            for i, r in zip(pending, response):
+                                responses[i] = r
+                                if _rate_limited(response=r) is not None:
+                                    retry.append(i)
+                                    limited = RateLimited()
+                            if not retry or attempt == MAX_RETRIES:
+                                sched.succeeded()
+                                return responses
+                            pending = retry
+                    sched.throttled(limited.retry_after)
+
+            return middleware
+
+    return RpcSchedulerMiddleware
+
+
+def install(w3, rate=None, burst=None):
+    """
+        Adds the scheduler middleware for w3's endpoint as the current outermost layer
+        (install rpc_cache after it so that cache hits do not use tokens)
+
+        HTTPProvider's own retries are switched off: they would resend a 429'd
+        request straight away, bypassing the bucket and the backoff.
+    """
+    provider = w3.provider
+    if hasattr(provider, "exception_retry_configuration"):
+        provider.exception_retry_configuration = None
+    endpoint = str(getattr(provider, "endpoint_uri", None) or id(provider))
+    sched = get_scheduler(endpoint, rate, burst)
+    w3.middleware_onion.add(scheduler_middleware(sched), name="rpc_scheduler")
+    return sched
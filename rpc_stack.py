@@ -0,0 +1,35 @@
+"""
+    The middleware stack every RPC connection in this repo runs with
+
+    From the provider outwards:
+
+        ExtraDataToPOAMiddleware   POA chains (avax, bsc) only, innermost
+        rpc_metrics                counts and times what reaches the node
+        rpc_scheduler              per-endpoint rate limit and priorities
+        rpc_cache                  answers final / immutable requests, outermost
+
+        w3 = rpc_stack.install(Web3(Web3.HTTPProvider(url)), "bsc")
+
+    AsyncWeb3 instances take the same stack.
+"""
+import rpc_cache
+import rpc_metrics
+import rpc_scheduler
+
+# chains whose block headers carry more extraData than web3 accepts without the POA middleware
+POA_CHAINS = {"avax", "bsc"}
+
+
+def install(w3, chain, metrics=rpc_metrics.METRICS, rate=None):
+    """
+        Adds the stack to w3 and returns w3.  'chain' ('avax', 'bsc', 'eth') names
+        the shared cache; None leaves the cache out.
+    """
+    if chain in POA_CHAINS:
+        from web3.middleware import ExtraDataToPOAMiddleware
+        w3.middleware_onion.inject(ExtraDataToPOAMiddleware, layer=0)
+    rpc_metrics.instrument(w3, metrics)
+    rpc_scheduler.install(w3, rate=rate)
+    if chain is not None:
+        rpc_cache.install(w3, chain)
+    return w3
@@ -1,11 +1,14 @@
 import eth_account
 import random
 import string
-import json
 from pathlib import Path
 from web3 import Web3
-from web3.middleware import ExtraDataToPOAMiddleware  # Necessary for POA chains
+from web3.exceptions import ContractLogicError, Web3Exception
 from eth_account.messages import encode_defunct
+import rpc_stack
+import abi_registry
+import claimed_leaves
+import fee_oracle
 
 
 def merkle_assignment():
@@ -25,9 +28,27 @@ def merkle_assignment():
     # Build a Merkle tree using the bytes32 leaves as the Merkle tree's leaves
     tree = build_merkle(leaves)
 
-    # Select a random leaf and create a proof for that leaf
-    random_leaf_index = random.randint(1, len(leaves) - 1) #TODO generate a random index from primes to claim (0 is already claimed)
-    proof = prove_merkle(tree, random_leaf_index)
+    # Select a random unclaimed leaf and create a proof for that leaf
+    random_leaf_index, claimed = pick_unclaimed_leaf(primes)
+    for _ in range(MAX_PICKS):
+        if random_leaf_index is None:
+            print("Every prime has already been claimed")
+            return
+        proof = prove_merkle(tree, random_leaf_index)
+        # the index only knows the claims it has scanned, let the contract have the last word
+        reason = submit_revert_reason(proof, leaves[random_leaf_index])
+        if reason is None:
+            break
+        if "claimed" in reason.lower():
+            claimed.mark(random_leaf_index)
+            claimed.save()
+        else:
+            # a bad proof or an account that already owns a prime says nothing about the leaf
+            claimed.skip(random_leaf_index)
+        random_leaf_index = claimed.pick_unclaimed()
+    else:
+        print(f"submit() reverted for {MAX_PICKS} different leaves, giving up")
+        return
 
     # This is the same way the grader generates a challenge for sign_challenge()
     challenge = ''.join(random.choice(string.ascii_letters) for i in range(32))
@@ -39,6 +60,49 @@ def merkle_assignment():
         # TODO, when you are ready to attempt to claim a prime (and pay gas fees),
         #  complete this method and run your code with the following line un-commented
         tx_hash = send_signed_msg(proof, leaves[random_leaf_index])
+        claimed.mark(random_leaf_index)
+        claimed.save()
+
+
+MAX_PICKS = 5  # leaves tried before giving up when submit() keeps reverting
+
+
+def pick_unclaimed_leaf(primes):
+    """
+        Returns (leaf index, claimed-leaf index) for a random leaf that has not been
+        claimed yet, refreshing the local index from the Merkle contract first.
+        If the node cannot be reached the index falls back to what it last saw.
+    """
+    claimed = claimed_leaves.ClaimedLeaves(primes)
+    try:
+        address, abi = get_contract_info('bsc')
+    except KeyError:
+        print("contract_info.json has no 'bsc' entry for the Merkle contract, cannot look up claimed primes")
+        raise
+    try:
+        w3 = connect_to('bsc')
+        contract = w3.eth.contract(address=Web3.to_checksum_address(address), abi=abi)
+        found = claimed.update(w3, contract)
+        print(f"{found} newly claimed primes found, {claimed.claimed_count()} of {len(primes)} taken")
+    except (OSError, Web3Exception) as e:
+        print(f"Could not refresh the claimed-leaf index ({e}), using the stored copy")
+    return claimed.pick_unclaimed(), claimed
+
+
+def submit_revert_reason(proof, leaf):
+    """
+        Simulates submit(proof, leaf) with eth_call, returns None when it would
+        succeed and the revert message when the contract would revert
+    """
+    address, abi = get_contract_info('bsc')
+    w3 = connect_to('bsc')
+    contract = w3.eth.contract(address=Web3.to_checksum_address(address), abi=abi)
+    try:
+        contract.functions.submit(proof, leaf).call({'from': get_account().address})
+        return None
+    except ContractLogicError as e:
+        print(f"submit() would revert for this leaf ({e}), picking another")
+        return str(e)
 
 
 def generate_primes(num_primes):
@@ -149,7 +213,7 @@ def send_signed_msg(proof, random_leaf):
                                             random_leaf).build_transaction({
         'from': acct.address,
         'nonce': w3.eth.get_transaction_count(acct.address),
-        'gasPrice': w3.to_wei('5', 'gwei'),
+        **fee_oracle.get_oracle(chain, w3).fee_params(3),
     })
 
     gas_estimate = w3.eth.estimate_gas({
@@ -181,11 +245,7 @@ def connect_to(chain):
         api_url = f"https://api.avax-test.network/ext/bc/C/rpc"  # AVAX C-chain testnet
     else:
         api_url = f"https://data-seed-prebsc-1-s1.binance.org:8545/"  # BSC testnet
-    w3 = Web3(Web3.HTTPProvider(api_url))
-    # inject the poa compatibility middleware to the innermost layer
-    w3.middleware_onion.inject(ExtraDataToPOAMiddleware, layer=0)
-
-    return w3
+    return rpc_stack.install(Web3(Web3.HTTPProvider(api_url)), chain)
 
 
 def get_account():
@@ -209,10 +269,8 @@ def get_contract_info(chain):
     contract_file = Path(__file__).parent.absolute() / "contract_info.json"
     if not contract_file.is_file():
         contract_file = Path(__file__).parent.parent.parent / "tests" / "contract_info.json"
-    with open(contract_file, "r") as f:
-        d = json.load(f)
-        d = d[chain]
-    return d['address'], d['abi']
+    spec = abi_registry.load(contract_file)[chain]
+    return spec.address, spec.abi
 
 
 def sign_challenge_verify(challenge, addr, sig):
@@ -0,0 +1,238 @@
+import pytest
+
+import listener
+import logdecoder
+
+web3 = pytest.importorskip("web3")
+from web3.providers import JSONBaseProvider
+
+TOKEN = "0x" + "aa" * 20
+SOURCE = "0x" + "11" * 20
+DEPOSIT_TOPIC = logdecoder.KNOWN_TOPICS["Deposit(address,address,uint256)"]
+DECODE_DEPOSIT = logdecoder.DECODERS[DEPOSIT_TOPIC]
+
+
+def raw_deposit(block, log_index=0, amount=1, removed=False, tx=None):
+    return {
+        "address": SOURCE,
+        "topics": [DEPOSIT_TOPIC, "0x" + TOKEN[2:].rjust(64, "0"), "0x" + "bb" * 32],
+        "data": "0x" + hex(amount)[2:].rjust(64, "0"),
+        "blockNumber": hex(block),
+        "blockHash": "0x" + "cc" * 32,
+        "transactionHash": tx or "0x" + f"{block:04x}{log_index:04x}".rjust(64, "0"),
+        "logIndex": hex(log_index),
+        "removed": removed,
+    }
+
+
+def deposit(block, log_index=0, **kwargs):
+    return DECODE_DEPOSIT(raw_deposit(block, log_index, **kwargs))
+
+
+def test_buffer_holds_events_until_confirmed():
+    buf = listener.ConfirmationBuffer(confirmations=2)
+    buf.add(deposit(10))
+    assert buf.release(11) == []
+    assert [e.blockNumber for e in buf.release(12)] == [10]
+    assert buf.release(13) == []
+
+
+def test_buffer_releases_in_chain_order():
+    buf = listener.ConfirmationBuffer(confirmations=0)
+    for block, idx in [(12, 1), (11, 3), (12, 0), (11, 0)]:
+        buf.add(deposit(block, idx))
+    assert [(e.blockNumber, e.logIndex) for e in buf.release(12)] == [(11, 0), (11, 3), (12, 0), (12, 1)]
+
+
+def test_buffer_discards_removed_logs():
+    buf = listener.ConfirmationBuffer(confirmations=1)
+    buf.add(deposit(5, amount=7))
+    buf.add(deposit(5, amount=7, removed=True))
+    assert buf.release(10) == []
+
+
+def test_buffer_replaces_redelivered_log():
+    buf = listener.ConfirmationBuffer(confirmations=1)
+    buf.add(deposit(5, amount=7))
+    buf.add(deposit(5, amount=8))
+    assert [e.amount for e in buf.release(6)] == [8]
+
+
+def test_buffer_drop_from_and_released_blocks():
+    buf = listener.ConfirmationBuffer(confirmations=1)
+    buf.add(deposit(5))
+    buf.add(deposit(6))
+    buf.add(deposit(7))
+    buf.drop_from(6)
+    assert [e.blockNumber for e in buf.release(8)] == [5]
+    # blocks at or below the released height are never emitted again
+    buf.add(deposit(6))
+    assert buf.released_upto == 7
+    assert buf.release(20) == []
+
+
+class StubNode(JSONBaseProvider):
+    """
+        Answers the handful of methods the filter listener uses from canned data
+    """
+    endpoint_uri = "stub://node"
+
+    def __init__(self, head, logs, expire_after=None):
+        super().__init__()
+        self.head = head
+        self.logs = logs            # every log the chain has, by block
+        self.expire_after = expire_after
+        self.filters = {}           # id -> block the filter has reported up to
+        self.calls = []
+
+    def make_request(self, method, params):
+        self.calls.append(method)
+        if method == "eth_blockNumber":
+            result = hex(self.head)
+        elif method == "eth_newFilter":
+            fid = hex(len(self.filters) + 1)
+            self.filters[fid] = self.head
+            result = fid
+        elif method == "eth_getFilterChanges":
+            fid = params[0]
+            if fid not in self.filters or (self.expire_after and self.calls.count(method) == self.expire_after):
+                self.filters.pop(fid, None)
+                self.head += 1  # and a block is mined before the listener notices
+                return {"jsonrpc": "2.0", "id": 0, "error": {"code": -32000, "message": "filter not found"}}
+            seen = self.filters[fid]
+            self.head += 1  # one new block per poll
+            self.filters[fid] = self.head
+            result = [l for l in self.logs if seen < int(l["blockNumber"], 16) <= self.head]
+        elif method == "eth_getLogs":
+            frm, to = int(params[0]["fromBlock"], 16), int(params[0]["toBlock"], 16)
+            result = [l for l in self.logs if frm <= int(l["blockNumber"], 16) <= to]
+        elif method == "eth_uninstallFilter":
+            result = self.filters.pop(params[0], None) is not None
+        else:
+            raise NotImplementedError(method)
+        return {"jsonrpc": "2.0", "id": 0, "result": result}
+
+
+def run_filter_listener(node, confirmations=1, polls=6):
+    w3 = web3.Web3(node)
+    buf = listener.ConfirmationBuffer(confirmations)
+    seen = []
+
+    def decode(logs):
+        for log in logs:
+            buf.add(DECODE_DEPOSIT(log))
+
+    def dispatch(head):
+        seen.extend(buf.release(head))
+
+    listener._listen_filter(w3, [SOURCE], [[DEPOSIT_TOPIC]], decode, buf, dispatch, 0, polls)
+    return seen, w3
+
+
+def test_filter_listener_dispatches_confirmed_events():
+    node = StubNode(100, [raw_deposit(101), raw_deposit(102, 1), raw_deposit(104)])
+    seen, _ = run_filter_listener(node, confirmations=1, polls=6)
+    assert [(e.blockNumber, e.logIndex) for e in seen] == [(101, 0), (102, 1), (104, 0)]
+    assert node.calls.count("eth_newFilter") == 1
+    assert node.filters == {}  # uninstalled on exit
+
+
+def test_filter_listener_reinstalls_expired_filter_without_gaps():
+    logs = [raw_deposit(b) for b in range(101, 110)]
+    node = StubNode(100, logs, expire_after=3)
+    seen, _ = run_filter_listener(node, confirmations=1, polls=8)
+    assert node.calls.count("eth_newFilter") == 2
+    assert "eth_getLogs" in node.calls
+    blocks = [e.blockNumber for e in seen]
+    assert blocks == sorted(set(blocks))
+    assert blocks == list(range(101, blocks[-1] + 1))
+
+
+def test_filter_listener_raises_other_errors():
+    class Broken(StubNode):
+        def make_request(self, method, params):
+            if method == "eth_getFilterChanges":
+                return {"jsonrpc": "2.0", "id": 0, "error": {"code": -32603, "message": "internal error"}}
+            return super().make_request(method, params)
+
+    with pytest.raises(Exception, match="internal error"):
+        run_filter_listener(Broken(100, []))
+
+
+def test_listen_falls_back_to_polling_when_websocket_fails(monkeypatch):
+    monkeypatch.setattr(listener, "WS_RECONNECTS", 0)
+    node = StubNode(100, [])
+    listener.listen("avax", handlers={"Deposit": lambda evt, w3: None}, w3=web3.Web3(node),
+                    ws_url="ws://127.0.0.1:9", poll_interval=0, max_heads=2)
+    assert node.calls.count("eth_getFilterChanges") == 2
+
+
+def test_token_filter_leaves_registrations_unfiltered(tmp_path):
+    erc20s = tmp_path / "erc20s.csv"
+    erc20s.write_text(f"chain,address\navax,{TOKEN}\n")
+    deposits = {DEPOSIT_TOPIC: ("Deposit", DECODE_DEPOSIT)}
+    topics, keep = listener.token_filter("avax", deposits, erc20s)
+    assert topics == [[DEPOSIT_TOPIC], [logdecoder.address_topic(TOKEN)]] and keep is None
+
+    reg_topic, decode_reg = logdecoder.make_decoder("Registration", [("token", "address", True)])
+    topics, keep = listener.token_filter("avax", {**deposits, reg_topic: ("Registration", decode_reg)}, erc20s)
+    assert topics == [[DEPOSIT_TOPIC, reg_topic]]
+    other = "0x" + "0" * 24 + "ee" * 20
+    assert keep(raw_deposit(1))
+    assert not keep({**raw_deposit(1), "topics": [DEPOSIT_TOPIC, other, "0x" + "bb" * 32]})
+    assert keep({**raw_deposit(1), "topics": [reg_topic, other]})
+
+
+def test_websocket_heads_fetch_logs_through_the_middleware():
+    import asyncio
+    import json
+    import rpc_metrics
+    from websockets.asyncio.server import serve
+
+    logs = [raw_deposit(101), raw_deposit(103)]
+    heads = [{"number": hex(n), "hash": "0x" + f"{n:064x}", "parentHash": "0x" + f"{n - 1:064x}"}
+             for n in (101, 102, 103)]
+
+    async def node(ws):
+        async for message in ws:
+            req = json.loads(message)
+            if req["method"] == "eth_subscribe":
+                await ws.send(json.dumps({"jsonrpc": "2.0", "id": req["id"], "result": "0x1"}))
+                for head in heads:
+                    await ws.send(json.dumps({"jsonrpc": "2.0", "method": "eth_subscription",
+                                              "params": {"subscription": "0x1", "result": head}}))
+            elif req["method"] == "eth_getLogs":
+                frm, to = int(req["params"][0]["fromBlock"], 16), int(req["params"][0]["toBlock"], 16)
+                result = [l for l in logs if frm <= int(l["blockNumber"], 16) <= to]
+                await ws.send(json.dumps({"jsonrpc": "2.0", "id": req["id"], "result": result}))
+            else:
+                await ws.send(json.dumps({"jsonrpc": "2.0", "id": req["id"], "result": None}))
+
+    buf = listener.ConfirmationBuffer(confirmations=0)
+    seen = []
+
+    def decode(raw):
+        for log in raw:
+            buf.add(DECODE_DEPOSIT(log))
+
+    async def run():
+        async with serve(node, "127.0.0.1", 0) as server:
+            url = f"ws://127.0.0.1:{server.sockets[0].getsockname()[1]}"
+            before = rpc_metrics.METRICS.snapshot().get(url, {}).get("eth_getLogs", {}).get("calls", 0)
+            await listener._listen_ws(url, [SOURCE], [[DEPOSIT_TOPIC]], decode, buf,
+                                      lambda head: seen.extend(buf.release(head)), max_heads=3)
+            return rpc_metrics.METRICS.snapshot()[url]["eth_getLogs"]["calls"] - before
+
+    assert asyncio.run(asyncio.wait_for(run(), 10)) == 3
+    assert [e.blockNumber for e in seen] == [101, 103]
+
+
+def test_token_filter_without_tokens_for_the_chain(tmp_path):
+    erc20s = tmp_path / "erc20s.csv"
+    erc20s.write_text(f"chain,address\navax,{TOKEN}\n")
+    deposits = {DEPOSIT_TOPIC: ("Deposit", DECODE_DEPOSIT)}
+    assert listener.token_filter("bsc", deposits, erc20s) == (None, None)
+
+    reg_topic, decode_reg = logdecoder.make_decoder("Registration", [("token", "address", True)])
+    topics, keep = listener.token_filter("bsc", {**deposits, reg_topic: ("Registration", decode_reg)}, erc20s)
+    assert topics == [[reg_topic]] and keep is None
@@ -0,0 +1,90 @@
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import mint
+
+
+class FakeChain:
+    """
+        Stands in for w3.eth: each sent claim takes the next outcome from 'script'
+
+            ok / revert  mined with status 1 / 0 before the receipt wait ends
+            late         mined, but only after its receipt wait timed out
+            stuck        never mined, its nonce stays unused
+    """
+
+    def __init__(self, script):
+        self.script = list(script)
+        self.txs = {}          # tx hash -> (nonce, outcome)
+        self.waits = []        # timeout passed to each receipt wait
+        self.account = SimpleNamespace(from_key=lambda key: FakeAccount(key))
+
+    def get_transaction_count(self, address, block="latest"):
+        if block == "pending":
+            return len(self.txs)
+        used = [n for n, outcome in self.txs.values() if outcome != "stuck"]
+        return max(used) + 1 if used else 0
+
+    def send_raw_transaction(self, tx):
+        tx_hash = len(self.txs).to_bytes(32, "big")
+        self.txs[tx_hash] = (tx["nonce"], self.script.pop(0))
+        return tx_hash
+
+    def wait_for_transaction_receipt(self, tx_hash, timeout):
+        self.waits.append(timeout)
+        outcome = self.txs[tx_hash][1]
+        if outcome in ("ok", "revert"):
+            return SimpleNamespace(status=int(outcome == "ok"))
+        time.sleep(timeout)
+        raise TimeoutError(f"no receipt after {timeout}s")
+
+    def get_transaction_receipt(self, tx_hash):
+        if self.txs[tx_hash][1] != "late":
+            raise LookupError("transaction not found")
+        return SimpleNamespace(status=1)
+
+
+class FakeAccount:
+    def __init__(self, key):
+        self.address = "0x" + key[-40:]
+
+    def sign_transaction(self, tx):
+        return SimpleNamespace(raw_transaction=tx)
+
+
+@pytest.fixture
+def chain(monkeypatch):
+    claim = lambda to, nonce: SimpleNamespace(build_transaction=lambda params: dict(params))
+    monkeypatch.setattr(mint.abi_registry, "contract",
+                        lambda *args, **kwargs: SimpleNamespace(functions=SimpleNamespace(claim=claim)))
+    oracle = SimpleNamespace(fee_params=lambda target: {})
+    monkeypatch.setattr(mint.fee_oracle, "get_oracle", lambda chain, w3: oracle)
+
+    def make(script):
+        return SimpleNamespace(eth=FakeChain(script))
+    return make
+
+
+def test_claim_batch_retries_reverts_but_never_resends_unconfirmed_claims(chain):
+    w3 = chain(["ok", "revert", "stuck", "late", "ok"])
+    succeeded = mint.claim_batch(["0x" + "11" * 32], 4, w3=w3, timeout=0.05)
+    outcomes = [w3.eth.txs[h][1] for h in succeeded]
+    assert sorted(outcomes) == ["late", "ok", "ok"]
+    # only the reverted claim was sent again, the stuck one may still mine
+    assert len(w3.eth.txs) == 5 and w3.eth.script == []
+
+
+def test_receipt_waits_share_one_deadline(chain):
+    w3 = chain(["stuck"] * 4)
+    start = time.monotonic()
+    ok, retry, pending = mint._claim_shard(w3, mint.abi_registry.contract(), FakeAccount("0x" + "22" * 32), 4, 0.3)
+    assert (ok, retry, pending) == ([], 0, 4)
+    assert w3.eth.waits[0] == pytest.approx(0.3, abs=0.05)
+    assert all(t <= 0.1 for t in w3.eth.waits[1:])
+    assert time.monotonic() - start < 0.9
+
+
+def test_claim_batch_without_keys(chain):
+    assert mint.claim_batch([], 3, w3=chain([])) == []
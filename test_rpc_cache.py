@@ -0,0 +1,101 @@
+import pytest
+
+import rpc_cache
+
+HEAD, FINALITY = 100, 10   # blocks up to 90 are final
+FINAL, RECENT = hex(90), hex(91)
+
+
+@pytest.fixture
+def cache():
+    cache = rpc_cache.ResponseCache(finality=FINALITY)
+    cache.see_head(HEAD)
+    return cache
+
+
+@pytest.mark.parametrize("block, final", [
+    (FINAL, True),
+    (RECENT, False),
+    (90, True),
+    ("earliest", True),
+    ("latest", False),
+    ("pending", False),
+    ("safe", False),
+    ("finalized", False),
+    ({"blockHash": "0x" + "ab" * 32}, True),
+    ({"blockNumber": FINAL}, True),
+    ({"blockNumber": RECENT}, False),
+    ({"blockNumber": "latest"}, False),
+])
+def test_block_param_final(cache, block, final):
+    assert rpc_cache._block_param_final(cache, block) is final
+
+
+@pytest.mark.parametrize("method, params, result, ok", [
+    ("eth_chainId", [], "0x61", True),
+    ("eth_blockNumber", [], "0x64", False),
+    ("eth_getBlockByNumber", [FINAL, False], {"number": FINAL}, True),
+    ("eth_getBlockByNumber", [RECENT, False], {"number": RECENT}, False),
+    ("eth_getBlockByNumber", ["latest", False], {"number": hex(HEAD)}, False),
+    ("eth_getBlockByNumber", [hex(200), False], None, False),
+    ("eth_getBlockByHash", ["0x" + "ab" * 32, False], {"number": RECENT}, True),
+    ("eth_getTransactionReceipt", ["0x01"], {"blockNumber": FINAL, "status": "0x1"}, True),
+    ("eth_getTransactionReceipt", ["0x01"], {"blockNumber": RECENT, "status": "0x1"}, False),
+    ("eth_getTransactionReceipt", ["0x01"], None, False),
+    ("eth_getTransactionByHash", ["0x01"], {"blockNumber": None, "nonce": "0x0"}, False),
+    ("eth_getTransactionByHash", ["0x01"], {"nonce": "0x0"}, False),
+    ("eth_call", [{"to": "0x01", "data": "0x"}, FINAL], "0x", True),
+    ("eth_call", [{"to": "0x01", "data": "0x"}, "latest"], "0x", False),
+    ("eth_call", [{"to": "0x01", "data": "0x"}], "0x", False),
+    ("eth_getBalance", ["0x01", {"blockHash": "0x" + "ab" * 32}], "0x1", True),
+    ("eth_getBalance", ["0x01", {"blockNumber": RECENT}], "0x1", False),
+    ("eth_getLogs", [{"fromBlock": hex(1), "toBlock": FINAL}], [], True),
+    ("eth_getLogs", [{"fromBlock": hex(1), "toBlock": RECENT}], [], False),
+    ("eth_getLogs", [{"fromBlock": hex(1), "toBlock": "latest"}], [], False),
+    ("eth_getLogs", [{"fromBlock": hex(1)}], [], False),
+    ("eth_getLogs", [{"blockHash": "0x" + "ab" * 32}], [], True),
+    ("eth_sendRawTransaction", ["0x00"], "0x" + "cd" * 32, False),
+])
+def test_cacheable(cache, method, params, result, ok):
+    assert rpc_cache.cacheable(cache, method, params, result) is ok
+
+
+def test_finality_moves_with_the_head(cache):
+    params = [{"fromBlock": hex(1), "toBlock": RECENT}]
+    assert not rpc_cache.cacheable(cache, "eth_getLogs", params, [])
+    cache.see_head(HEAD + 1)
+    assert rpc_cache.cacheable(cache, "eth_getLogs", params, [])
+    cache.see_head(HEAD - 50)  # a lagging node never moves the head back
+    assert cache.head == HEAD + 1
+
+
+def test_batch_fetches_only_misses(cache):
+    pytest.importorskip("web3")
+    middleware = rpc_cache.cache_middleware(cache)(None)
+    sent = []
+
+    def make_batch_request(requests_info):
+        sent.append([params[0] for _, params in requests_info])
+        return [{"jsonrpc": "2.0", "id": 0, "result": {"number": params[0]}} for _, params in requests_info]
+
+    batch = middleware.wrap_make_batch_request(make_batch_request)
+    calls = [("eth_getBlockByNumber", [FINAL, False]), ("eth_getBlockByNumber", [RECENT, False])]
+    first = batch(calls)
+    second = batch(calls + [("eth_getBlockByNumber", [hex(80), False])])
+    # the final block is served from the cache, the recent one is fetched every time
+    assert sent == [[FINAL, RECENT], [RECENT, hex(80)]]
+    assert [r["result"]["number"] for r in second] == [FINAL, RECENT, hex(80)]
+    assert first[0] == second[0]
+
+    # the whole batch answered from the cache never reaches the node
+    assert batch([calls[0], ("eth_getBlockByNumber", [hex(80), False])])[1]["result"]["number"] == hex(80)
+    assert len(sent) == 2
+
+
+def test_refused_batch_is_not_cached(cache):
+    pytest.importorskip("web3")
+    middleware = rpc_cache.cache_middleware(cache)(None)
+    refused = {"jsonrpc": "2.0", "id": None, "error": {"code": -32600, "message": "batch too large"}}
+    batch = middleware.wrap_make_batch_request(lambda requests_info: refused)
+    assert batch([("eth_getBlockByNumber", [FINAL, False])]) is refused
+    assert len(cache) == 0
@@ -0,0 +1,90 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import rpc_scheduler
+
+web3 = pytest.importorskip("web3")
+
+
+def test_waiters_are_served_by_priority():
+    sched = rpc_scheduler.EndpointScheduler(rate=100, burst=1)
+    sched.paused_until = time.monotonic() + 0.2  # let everyone queue up first
+    order = []
+
+    def take(level):
+        sched.acquire(level)
+        order.append(level)
+
+    threads = []
+    for level in (rpc_scheduler.BACKFILL, rpc_scheduler.HEAD, rpc_scheduler.TX):
+        t = threading.Thread(target=take, args=(level,))
+        t.start()
+        threads.append(t)
+        while len(sched._waiting) < len(threads):
+            time.sleep(0.001)
+    for t in threads:
+        t.join(5)
+    assert order == [rpc_scheduler.TX, rpc_scheduler.HEAD, rpc_scheduler.BACKFILL]
+
+
+def test_rate_halves_on_throttle_and_recovers():
+    sched = rpc_scheduler.EndpointScheduler(rate=20, burst=1)
+    sched.throttled(retry_after=0)
+    sched.throttled(retry_after=0)
+    assert sched.rate == 5 and sched.failures == 2
+    for _ in range(100):
+        sched.succeeded()
+    assert sched.rate == 20 and sched.failures == 0
+
+
+def test_batch_resends_only_rate_limited_calls(monkeypatch):
+    monkeypatch.setattr(rpc_scheduler, "MAX_BACKOFF", 0.01)
+    sent = []
+    limited = {"jsonrpc": "2.0", "id": 0, "error": {"code": 429, "message": "rate limited"}}
+
+    def make_batch_request(requests_info):
+        sent.append([m for m, _ in requests_info])
+        if len(sent) == 1:
+            return [{"result": 1}, limited, {"result": 3}]
+        return [{"result": 2}]
+
+    sched = rpc_scheduler.EndpointScheduler(rate=1000, burst=10)
+    middleware = rpc_scheduler.scheduler_middleware(sched)(None)
+    batch = middleware.wrap_make_batch_request(make_batch_request)
+    responses = batch([("eth_call", []), ("eth_getBalance", []), ("eth_chainId", [])])
+    assert sent == [["eth_call", "eth_getBalance", "eth_chainId"], ["eth_getBalance"]]
+    assert [r["result"] for r in responses] == [1, 2, 3]
+    assert sched.failures == 0
+
+
+def test_429s_go_through_the_scheduler_only(monkeypatch):
+    monkeypatch.setattr(rpc_scheduler, "MAX_RETRIES", 1)
+    hits = []
+
+    class TooManyRequests(BaseHTTPRequestHandler):
+        def do_POST(self):
+            self.rfile.read(int(self.headers["Content-Length"]))
+            hits.append(self.path)
+            self.send_response(429)
+            self.send_header("Retry-After", "0")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), TooManyRequests)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        w3 = web3.Web3(web3.HTTPProvider(f"http://127.0.0.1:{server.server_port}"))
+        sched = rpc_scheduler.install(w3)
+        with pytest.raises(Exception, match="429"):
+            w3.eth.block_number
+    finally:
+        server.shutdown()
+    # one request per scheduler attempt, none from HTTPProvider's own retries
+    assert len(hits) == rpc_scheduler.MAX_RETRIES + 1
+    assert sched.failures == 1
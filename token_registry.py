@@ -0,0 +1,153 @@
+"""
+    In-memory index of the tokens the bridge can relay
+
+    Source only accepts withdraw() for tokens it has registered, and Destination
+    only accepts wrap() for underlying tokens it has created a wrapped token
+    for.  Relaying anything else reverts after paying gas.  This registry keeps
+    both sets in dicts so each relay is checked in O(1) before a transaction is
+    built:
+
+      * seeded from erc20s.csv ('avax' rows are registered on Source, 'bsc' rows
+        have a wrapped token on Destination),
+      * updated from Source.Registration and Destination.Creation events as the
+        bridge sees them,
+      * for a token it has never seen, asked once on chain (approved() /
+        wrapped_tokens()), and the answer is remembered.
+
+    Destination.createToken emits Creation before deploying the wrapped token,
+    so the event carries wrapped_token == 0x0; the wrapped address is resolved
+    with wrapped_tokens() the first time wrapped_token() needs it.
+"""
+import json
+import os
+
+import logdecoder
+
+ZERO = "0x" + "0" * 40
+STATE_FILE = ".bridge.tokens.json"
+
+
+def _key(addr):
+    return addr.lower()
+
+
+class TokenRegistry:
+
+    def __init__(self, path=STATE_FILE):
+        self.path = path
+        self.registered = set()   # underlying tokens approved on Source
+        self.created = set()      # underlying tokens with a wrapped token on Destination
+        self.wrapped_of = {}      # underlying -> wrapped
+        self.underlying_of = {}   # wrapped -> underlying
+        self._rejected = set()    # (kind, token) checked on chain and refused, this process only
+        if path and os.path.exists(path):
+            self.load()
+
+    def seed_from_csv(self, erc20s="erc20s.csv"):
+        for chain, addr in logdecoder.load_erc20s(erc20s):
+            if chain == "avax":
+                self.registered.add(_key(addr))
+            elif chain == "bsc":
+                self.created.add(_key(addr))
+        return self
+
+    def add_wrapped(self, underlying, wrapped):
+        u = _key(underlying)
+        self.created.add(u)
+        if wrapped and _key(wrapped) != ZERO:
+            self.wrapped_of[u] = _key(wrapped)
+            self.underlying_of[_key(wrapped)] = u
+
+    def apply(self, evt):
+        """
+            Updates the registry from a decoded Registration or Creation record (see logdecoder)
+        """
+        if evt.event == "Registration":
+            self.registered.add(_key(evt.token))
+            self._rejected.discard(("withdraw", _key(evt.token)))
+        elif evt.event == "Creation":
+            self.add_wrapped(evt.underlying_token, evt.wrapped_token)
+            self._rejected.discard(("wrap", _key(evt.underlying_token)))
+
+    def can_withdraw(self, underlying, source=None):
+        """
+            True when Source will accept withdraw() for this token.  'source' is the
+            Source contract, used once for tokens the registry has not seen.
+        """
+        u = _key(underlying)
+        if u in self.registered:
+            return True
+        if ("withdraw", u) in self._rejected or source is None:
+            return False
+        from web3 import Web3
+        if source.functions.approved(Web3.to_checksum_address(u)).call():
+            self.registered.add(u)
+            return True
+        self._rejected.add(("withdraw", u))
+        return False
+
+    def can_wrap(self, underlying, destination=None):
+        """
+            True when Destination will accept wrap() for this underlying token.
+            Tokens from the seed or a Creation event are trusted without a call;
+            'destination' is the Destination contract, used once per unknown token.
+        """
+        return _key(underlying) in self.created or self.wrapped_token(underlying, destination) is not None
+
+    def wrapped_token(self, underlying, destination=None):
+        """
+            Address of the wrapped token for 'underlying', or None when there is none.
+            'destination' is used once to resolve a token whose wrapped address is not known yet.
+        """
+        u = _key(underlying)
+        if u in self.wrapped_of:
+            return self.wrapped_of[u]
+        if ("wrap", u) in self._rejected or destination is None:
+            return None
+        from web3 import Web3
+        wrapped = destination.functions.wrapped_tokens(Web3.to_checksum_address(u)).call()
+        if _key(wrapped) != ZERO:
+            self.add_wrapped(u, wrapped)
+            return self.wrapped_of[u]
+        self._rejected.add(("wrap", u))
+        return None
+
+    def is_consistent_unwrap(self, underlying, wrapped):
+        """
+            False when an Unwrap pairs a wrapped token with a different underlying than we know of
+        """
+        known = self.underlying_of.get(_key(wrapped))
+        return known is None or known == _key(underlying)
+
+    def load(self):
+        with open(self.path, "r") as f:
+            state = json.load(f)
+        self.registered.update(state.get("registered", []))
+        self.created.update(state.get("created", []))
+        for u, w in state.get("wrapped", {}).items():
+            self.add_wrapped(u, w)
+
+    def save(self):
+        if not self.path:
+            return
+        with open(self.path, "w") as f:
+            json.dump({
+                "registered": sorted(self.registered),
+                "created": sorted(self.created),
+                "wrapped": self.wrapped_of,
+            }, f)
+
+
+_registry = None
+
+
+def get_registry(erc20s="erc20s.csv", path=STATE_FILE):
+    """
+        Returns the process-wide registry, loaded from 'path' and seeded from 'erc20s' on first use
+    """
+    global _registry
+    if _registry is None:
+        _registry = TokenRegistry(path)
+        if erc20s and os.path.exists(erc20s):
+            _registry.seed_from_csv(erc20s)
+    return _registry